@@ -0,0 +1,128 @@
+"""
+Citation splicing on synthetic grounded answers.
+
+    python -m benchmarks.bench_citations [--chars 50000] [--supports 3000]
+
+Compares the previous approach (model_dump() of the whole response, then
+string concatenation at character offsets, first chunk only) with
+splice_citations (grounding read from the response objects, one join over
+UTF-8 byte offsets, every cited chunk).
+"""
+
+import argparse
+import random
+import time
+
+from google.genai import types
+
+from src.citations import splice_citations
+
+
+WORDS = ["énergie", "hydrogène", "réseau", "décarbonation", "stockage", "éolien", "coût", "marché",
+         "capacité", "électrolyse", "production", "demande", "prévision", "investissement"]
+
+
+def build_response(chars: int, supports: int, chunks: int, rng: random.Random):
+    words = []
+    size = 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    answer = " ".join(words)[:chars]
+
+    # Supports end on word boundaries, expressed as UTF-8 byte offsets
+    data = answer.encode("utf-8")
+    boundaries = [i for i, byte in enumerate(data) if byte == 0x20]
+    ends = sorted(rng.sample(boundaries, min(supports, len(boundaries))))
+
+    metadata = types.GroundingMetadata(
+        grounding_chunks=[
+            types.GroundingChunk(web=types.GroundingChunkWeb(uri=f"https://example.org/{i}", title=f"Source {i}"))
+            for i in range(chunks)
+        ],
+        grounding_supports=[
+            types.GroundingSupport(
+                segment=types.Segment(start_index=max(0, end - 40), end_index=end),
+                grounding_chunk_indices=rng.sample(range(chunks), rng.randint(1, 3)),
+            )
+            for end in ends
+        ],
+    )
+    response = types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=[types.Part(text=answer)]),
+                        grounding_metadata=metadata)
+    ])
+    return response, answer
+
+
+def legacy_splice(response, answer: str):
+    """The former format_text_with_sources, kept here as the baseline"""
+    response_dict = response.model_dump()
+    grounding_metadata = response_dict['candidates'][0].get('grounding_metadata')
+    grounding_chunks = grounding_metadata.get('grounding_chunks', [])
+    grounding_supports = grounding_metadata.get('grounding_supports', [])
+    sources = {
+        i: {'link': chunk.get('web', {}).get('uri', ''), 'title': chunk.get('web', {}).get('title', '')}
+        for i, chunk in enumerate(grounding_chunks)
+        if chunk.get('web')
+    }
+    citations = []
+    for support in grounding_supports:
+        segment = support.get('segment', {})
+        indices = support.get('grounding_chunk_indices', [])
+        if indices and segment and segment.get('end_index') is not None:
+            source_idx = indices[0]
+            if source_idx in sources:
+                citations.append((segment['end_index'], f"[[{source_idx + 1}]]({sources[source_idx]['link']})"))
+    citations.sort(key=lambda x: x[0])
+    result = ""
+    last_pos = 0
+    for pos, citation in citations:
+        result += answer[last_pos:pos]
+        result += citation
+        last_pos = pos
+    result += answer[last_pos:]
+    return result, sources
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def misplaced(text: str) -> int:
+    """Citations glued inside a word, i.e. not followed by a space or the end"""
+    count = 0
+    for end in (i + 1 for i, char in enumerate(text) if char == ")"):
+        if end < len(text) and text[end] not in " [":
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chars", type=int, default=50000)
+    parser.add_argument("--supports", type=int, default=3000)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    response, answer = build_response(args.chars, args.supports, args.chunks, random.Random(42))
+
+    legacy_time, (legacy_text, _) = timed(lambda: legacy_splice(response, answer), args.repeat)
+    splice_time, (spliced_text, _) = timed(lambda: splice_citations(response, answer), args.repeat)
+
+    print(f"answer         : {len(answer)} chars, {len(answer.encode('utf-8'))} bytes")
+    print(f"supports       : {len(response.candidates[0].grounding_metadata.grounding_supports)}")
+    print(f"legacy         : {legacy_time * 1000:.1f} ms, {legacy_text.count('[[')} citations, "
+          f"{misplaced(legacy_text)} misplaced")
+    print(f"splice         : {splice_time * 1000:.1f} ms, {spliced_text.count('[[')} citations, "
+          f"{misplaced(spliced_text)} misplaced")
+    print(f"speedup        : {legacy_time / splice_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Per-call overhead of the gateway's pooled Gemini client versus one client per request.
+
+A local HTTP/1.1 server stands in for the Gemini endpoint (google.genai
+clients are pointed at it through http_options.base_url), so the numbers
+only reflect client-side costs: connection setup (no TLS here, so real
+savings are larger) and rebuilding the generation config.
+
+    python -m benchmarks.bench_client_pool [--calls 200]
+
+"new client per call" builds a google.genai Client and its config for every
+grounded search, as search() used to; "gateway" times
+GeminiGateway.generate_grounded(), which reuses one client and one config.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google import genai as genai_client
+from google.genai import types
+
+from src.gemini_gateway import GeminiGateway
+from src.generation_profiles import GENERATION_PROFILES
+from src.rate_limiter import RateLimiter
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = json.dumps({"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}).encode()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def stand_in_client(options: types.HttpOptions) -> genai_client.Client:
+    return genai_client.Client(api_key="benchmark", http_options=options)
+
+
+async def per_call_clients(options: types.HttpOptions, calls: int) -> float:
+    profile = GENERATION_PROFILES["grounded_search"]
+    start = time.perf_counter()
+    for i in range(calls):
+        client = stand_in_client(options)
+        config = types.GenerateContentConfig(**profile["config"])
+        await client.aio.models.generate_content(model=profile["model"], contents=f"query {i}", config=config)
+        await client.aio.aclose()
+    return time.perf_counter() - start
+
+
+async def gateway_calls(options: types.HttpOptions, calls: int) -> float:
+    gateway = GeminiGateway("benchmark", rate_limiter=RateLimiter())
+    gateway.clients = {label: stand_in_client(options) for label in gateway.clients}
+    start = time.perf_counter()
+    for i in range(calls):
+        await gateway.generate_grounded(f"query {i}")
+    elapsed = time.perf_counter() - start
+    await gateway.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    options = types.HttpOptions(base_url=f"http://127.0.0.1:{server.server_address[1]}/")
+
+    fresh = asyncio.run(per_call_clients(options, args.calls))
+    pooled = asyncio.run(gateway_calls(options, args.calls))
+    server.shutdown()
+
+    per_call = lambda total: total / args.calls * 1000
+    print(f"calls: {args.calls}")
+    print(f"new client per call : {per_call(fresh):7.3f} ms/call")
+    print(f"gateway (pooled)    : {per_call(pooled):7.3f} ms/call")
+    print(f"overhead saved      : {per_call(fresh - pooled):7.3f} ms/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Hedged grounded searches against a simulated long-tail latency.
+
+    python -m benchmarks.bench_hedging [--calls 400] [--percentile 95] [--tail 0.05]
+
+Runs the same levels of concurrent generate_grounded() calls through a
+GeminiGateway without and with a HedgePolicy, against a fake client whose
+answers take 20-40 ms, except a --tail fraction that stalls for 1 s, and
+compares the send-to-answer latency percentiles and the requests sent.
+"""
+
+import argparse
+import asyncio
+import random
+import types
+
+from src.gemini_gateway import GeminiGateway
+from src.hedging import HedgePolicy
+from src.metrics import RunMetrics
+from src.rate_limiter import RateLimiter
+
+
+class FakeResponse:
+    text = "answer"
+    usage_metadata = None
+    candidates = []
+
+
+def fake_client(rng: random.Random, tail: float, sent: list):
+    async def generate_content(model, contents, config):
+        sent.append(contents)
+        await asyncio.sleep(1.0 if rng.random() < tail else rng.uniform(0.02, 0.04))
+        return FakeResponse()
+
+    return types.SimpleNamespace(aio=types.SimpleNamespace(models=types.SimpleNamespace(
+        generate_content=generate_content)))
+
+
+async def run(calls: int, level: int, tail: float, percentile: float = None) -> tuple[RunMetrics, int]:
+    metrics = RunMetrics()
+    limits = {"gemini-2.0-flash": {"rpm": 1_000_000, "tpm": 1_000_000_000}}
+    policies = {"grounded_search": HedgePolicy(percentile, min_delay=0.05)} if percentile else None
+    gateway = GeminiGateway("benchmark", rate_limiter=RateLimiter(limits), metrics=metrics,
+                            hedge_policies=policies)
+    sent = []
+    gateway.clients = {label: fake_client(random.Random(42), tail, sent) for label in gateway.clients}
+    for start in range(0, calls, level):
+        await asyncio.gather(*(gateway.generate_grounded(f"query {i}")
+                               for i in range(start, min(start + level, calls))))
+    return metrics, len(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--level", type=int, default=10, help="Concurrent calls per level")
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--tail", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for label, percentile in (("no hedging", None), (f"hedged at p{args.percentile:g}", args.percentile)):
+        metrics, sent = asyncio.run(run(args.calls, args.level, args.tail, percentile))
+        latency = metrics.latency_summary("latency_grounded_search")
+        print(f"{label:<15}: p50 {latency['p50'] * 1000:.0f} ms, p95 {latency['p95'] * 1000:.0f} ms, "
+              f"p99 {latency['p99'] * 1000:.0f} ms, {sent} requests for {latency['count']} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Near-duplicate clustering of learnings before report generation.
+
+    python -m benchmarks.bench_learning_dedup [--learnings 5000]
+"""
+
+import argparse
+import random
+import time
+
+from src.learning_dedup import cluster_learnings
+
+
+TEMPLATES = [
+    "En {year}, {entity} a investi {amount} milliards d'euros dans {topic}.",
+    "{entity} prévoit de doubler ses capacités de {topic} d'ici {year}.",
+    "Selon {entity}, le marché de {topic} atteindra {amount} milliards en {year}.",
+    "Le rapport de {entity} publié en {year} estime que {topic} représente {amount}% des émissions.",
+]
+ENTITIES = ["l'Union européenne", "la Chine", "TotalEnergies", "l'AIE", "EDF", "Siemens", "l'OCDE", "Tesla"]
+TOPICS = ["l'hydrogène vert", "l'énergie solaire", "les batteries", "l'éolien en mer", "le nucléaire", "le recyclage"]
+
+
+def generate(count: int, rng: random.Random) -> list[str]:
+    learnings = []
+    for _ in range(count):
+        learning = rng.choice(TEMPLATES).format(
+            year=rng.randint(2015, 2030), entity=rng.choice(ENTITIES),
+            amount=rng.randint(1, 500), topic=rng.choice(TOPICS))
+        if learnings and rng.random() < 0.3:
+            # Paraphrase of an earlier learning, as produced by a parallel branch
+            learning = rng.choice(learnings).replace("Selon", "D'après").rstrip(".") + " environ."
+        learnings.append(learning)
+    return learnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--learnings", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    learnings = generate(args.learnings, random.Random(42))
+
+    start = time.perf_counter()
+    clusters = cluster_learnings(learnings, threshold=args.threshold)
+    elapsed = time.perf_counter() - start
+
+    print(f"learnings      : {len(learnings)}")
+    print(f"exact-unique   : {len(set(learnings))}")
+    print(f"clusters       : {len(clusters)}")
+    print(f"elapsed        : {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
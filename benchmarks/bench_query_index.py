@@ -0,0 +1,78 @@
+"""
+Lookup cost of the LSH query index as query_history grows.
+
+Each lookup replaces what used to be one Gemini call per (candidate, known
+query) pair in DeepSearch._are_queries_similar.
+
+    python -m benchmarks.bench_query_index [--queries 20000] [--lookups 1000]
+"""
+
+import argparse
+import random
+import time
+
+from src.query_index import DUPLICATE_THRESHOLD, QueryIndex
+
+
+VOCABULARY = (
+    "impact intelligence artificielle santé publique énergie solaire coûts "
+    "politique monétaire inflation europe chine startups financement climat "
+    "agriculture eau batteries lithium recyclage vaccins essais cliniques "
+    "régulation données vie privée éducation emploi automatisation transport "
+    "hydrogène nucléaire réseaux électriques semi-conducteurs marché 2023 2024 2025"
+).split()
+
+WORDS = []
+
+
+def build_vocabulary(rng: random.Random, size: int = 5000) -> list[str]:
+    """Topic words plus pseudo-words so the history has realistic diversity"""
+    syllables = ["ka", "ro", "mi", "tes", "lu", "van", "dor", "pe", "si", "gra", "nu", "bel"]
+    words = set(VOCABULARY)
+    while len(words) < size:
+        words.add("".join(rng.choices(syllables, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def random_query(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(4, 9)))
+
+
+def paraphrase(query: str, rng: random.Random) -> str:
+    words = query.split()
+    words.insert(rng.randrange(len(words) + 1), rng.choice(WORDS))
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    WORDS[:] = build_vocabulary(rng)
+    history = [random_query(rng) for _ in range(args.queries)]
+    index = QueryIndex()
+
+    start = time.perf_counter()
+    for query in history:
+        index.add(query)
+    build = time.perf_counter() - start
+
+    probes = [paraphrase(rng.choice(history), rng) for _ in range(args.lookups // 2)]
+    probes += [random_query(rng) for _ in range(args.lookups - len(probes))]
+
+    start = time.perf_counter()
+    duplicates = sum(index.most_similar(probe)[1] >= DUPLICATE_THRESHOLD for probe in probes)
+    lookup = time.perf_counter() - start
+
+    print(f"indexed queries   : {len(index)}")
+    print(f"build             : {build / len(index) * 1e6:8.1f} us/query")
+    print(f"lookup            : {lookup / len(probes) * 1e6:8.1f} us/lookup")
+    print(f"near-duplicates   : {duplicates}/{len(probes)}")
+    print(f"LLM calls avoided : {len(index)} per lookup with pairwise comparison")
+
+
+if __name__ == "__main__":
+    main()
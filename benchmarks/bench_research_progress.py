@@ -0,0 +1,74 @@
+"""
+ResearchProgress bookkeeping on large research trees.
+
+    python -m benchmarks.bench_research_progress [--nodes 100000] [--fanout 4]
+
+Starts every node of a synthetic tree, completes the leaves (completion
+propagates up to the root) and exports the tree. No event bus is
+attached, so only the bookkeeping is measured. --fanout 1 builds a
+single chain, deeper than any recursive export could follow.
+"""
+
+import argparse
+import time
+
+from src.deep_research import ResearchProgress
+
+
+def build(progress: ResearchProgress, nodes: int, fanout: int) -> list[tuple[str, int]]:
+    """Start a breadth-first tree of the given size; returns the leaves"""
+    depth = nodes
+    if fanout > 1:
+        depth = 1
+        while fanout ** depth < nodes:
+            depth += 1
+    progress.start_query("q0", depth)
+    level = [("q0", depth)]
+    leaves = []
+    count = 1
+    while level:
+        next_level = []
+        for query, node_depth in level:
+            children = 0
+            while node_depth > 0 and children < fanout and count < nodes:
+                child = (f"q{count}", node_depth - 1)
+                progress.start_query(child[0], child[1], query)
+                next_level.append(child)
+                children += 1
+                count += 1
+            if not children:
+                leaves.append((query, node_depth))
+        level = next_level
+    return leaves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--fanout", type=int, default=4)
+    args = parser.parse_args()
+
+    progress = ResearchProgress(depth=0, breadth=args.fanout)
+
+    start = time.perf_counter()
+    leaves = build(progress, args.nodes, args.fanout)
+    started = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query, depth in leaves:
+        progress.complete_query(query, depth)
+    completed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree = progress._build_research_tree()
+    exported = time.perf_counter() - start
+
+    print(f"nodes          : {progress.total_queries}")
+    print(f"completed      : {progress.completed_queries} (root {tree['status']})")
+    print(f"start all      : {started * 1000:.1f} ms")
+    print(f"complete leaves: {completed * 1000:.1f} ms ({completed / len(leaves) * 1e6:.2f} us per leaf)")
+    print(f"export tree    : {exported * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,220 @@
 import argparse
 import asyncio
-import os
+import json
 import time
 
+from src.budget import ResearchBudget
+from src.checkpoint import ResearchCheckpoint, new_run_id
 from src.deep_research import DeepSearch
+from src.extraction_batcher import EXTRACTION_BATCH_WINDOW
+from src.key_pool import load_api_keys
+from src.progress_events import print_event
+
+
+def make_budget(args) -> ResearchBudget:
+    """Budget of the research phase; its deadline runs from this call"""
+    return ResearchBudget(
+        max_calls=args.max_calls,
+        max_input_tokens=args.max_input_tokens,
+        max_output_tokens=args.max_output_tokens,
+        deadline=args.deadline
+    )
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Run deep search queries')
-    parser.add_argument('query', type=str, help='The search query')
-    parser.add_argument('--mode', type=str, choices=['fast', 'balanced', 'comprehensive'],
-                        default='balanced', help='Research mode (default: balanced)')
-    parser.add_argument('--num-queries', type=int, default=3,
-                        help='Number of queries to generate (default: 3)')
-    parser.add_argument('--learnings', nargs='*', default=[],
-                        help='List of previous learnings')
-
-    args = parser.parse_args()
-
+async def run(args):
     # Start the timer
     start_time = time.time()
 
-    # Get API key from environment variable
-    api_key = os.getenv('GEMINI_KEY')
-    if not api_key:
-        raise ValueError("Please set GEMINI_KEY environment variable")
-
-    deep_search = DeepSearch(api_key, mode=args.mode)
-
-    breadth_and_depth = deep_search.determine_research_breadth_and_depth(
-        args.query)
-
-    breadth = breadth_and_depth["breadth"]
-    depth = breadth_and_depth["depth"]
-    explanation = breadth_and_depth["explanation"]
-
-    print(f"Breadth: {breadth}")
-    print(f"Depth: {depth}")
-    print(f"Explanation: {explanation}")
-
-    print("To better understand your research needs, please answer these follow-up questions:")
-
-    follow_up_questions = deep_search.generate_follow_up_questions(args.query)
-
-    # get answers to the follow up questions
-    answers = []
-    for question in follow_up_questions:
-        answer = input(f"{question}: ")
-        answers.append({
-            "question": question,
-            "answer": answer
-        })
-
-    questions_and_answers = "\n".join(
-        [f"{answer['question']}: {answer['answer']}" for answer in answers])
-
-    combined_query = f"Initial query: {args.query}\n\n Follow up questions and answers: {questions_and_answers}"
-
-    print(f"\nHere is the combined query: {combined_query}\n\n")
-
-    print("Starting research... \n")
-
-    # Run the deep research
-    results = asyncio.run(deep_search.deep_research(
-        query=combined_query,
-        breadth=breadth,
-        depth=depth,
-        learnings=[],
-        visited_urls={}
-    ))
+    # Get API keys from GEMINI_KEYS_FILE, GEMINI_KEYS or GEMINI_KEY
+    api_keys = load_api_keys()
+    if not api_keys:
+        raise ValueError("Please set GEMINI_KEY (or GEMINI_KEYS / GEMINI_KEYS_FILE) environment variable")
+
+    if args.resume:
+        checkpoint = ResearchCheckpoint(args.resume)
+        if not checkpoint.exists():
+            raise ValueError(f"No checkpoint found for run {args.resume}")
+        state = checkpoint.load()
+
+        deep_search = DeepSearch(api_keys[0], api_keys=api_keys, mode=state["mode"], memo_mode=args.memo,
+                                 report_strategy=args.report_strategy,
+                                 speculative_searches=args.speculate,
+                                 pipeline=args.pipeline,
+                                 extraction_batch_window=args.batch_window,
+                                 hedge={"grounded_search": args.hedge} if args.hedge else None)
+        deep_search.events.subscribe(print_event)
+
+        combined_query = state["query"]
+        print(f"Resuming research run {args.resume}... \n")
+
+        # Only the sub-queries still pending are researched
+        results = await deep_search.resume_research(args.resume, budget=make_budget(args))
+    else:
+        deep_search = DeepSearch(api_keys[0], api_keys=api_keys, mode=args.mode, memo_mode=args.memo,
+                                 report_strategy=args.report_strategy,
+                                 speculative_searches=args.speculate,
+                                 pipeline=args.pipeline,
+                                 extraction_batch_window=args.batch_window,
+                                 hedge={"grounded_search": args.hedge} if args.hedge else None)
+        deep_search.events.subscribe(print_event)
+
+        breadth_and_depth = await deep_search.determine_research_breadth_and_depth(args.query)
+
+        breadth = breadth_and_depth["breadth"]
+        depth = breadth_and_depth["depth"]
+        explanation = breadth_and_depth["explanation"]
+
+        print(f"Breadth: {breadth}")
+        print(f"Depth: {depth}")
+        print(f"Explanation: {explanation}")
+
+        print("To better understand your research needs, please answer these follow-up questions:")
+
+        follow_up_questions = await deep_search.generate_follow_up_questions(
+            args.query)
+
+        # get answers to the follow up questions
+        answers = []
+        for question in follow_up_questions:
+            answer = input(f"{question}: ")
+            answers.append({
+                "question": question,
+                "answer": answer
+            })
+
+        questions_and_answers = "\n".join(
+            [f"{answer['question']}: {answer['answer']}" for answer in answers])
+
+        combined_query = f"Initial query: {args.query}\n\n Follow up questions and answers: {questions_and_answers}"
+
+        print(f"\nHere is the combined query: {combined_query}\n\n")
+
+        print(f"Starting research (run {args.run_id})... \n")
+
+        # Run the deep research
+        results = await deep_search.deep_research(
+            query=combined_query,
+            breadth=breadth,
+            depth=depth,
+            learnings=[],
+            visited_urls={},
+            budget=make_budget(args),
+            run_id=args.run_id
+        )
 
     # Generate and print the final report
-    final_report = deep_search.generate_final_report(
-        query=combined_query,
-        learnings=results["learnings"],
-        visited_urls=results["visited_urls"]
-    )
+    if args.stream:
+        print("\nFinal Research Report:")
+        print("=====================")
+        with open("final_report.md", "w") as f:
+            def on_chunk(text):
+                print(text, end="", flush=True)
+                f.write(text)
+                f.flush()
+
+            final_report = await deep_search.generate_final_report(
+                query=combined_query,
+                learnings=results["learnings"],
+                visited_urls=results["visited_urls"],
+                on_chunk=on_chunk,
+                branches=results["learning_branches"]
+            )
+        print()
+    else:
+        final_report = await deep_search.generate_final_report(
+            query=combined_query,
+            learnings=results["learnings"],
+            visited_urls=results["visited_urls"],
+            branches=results["learning_branches"]
+        )
+
+    await deep_search.close()
 
     # Calculate elapsed time
     elapsed_time = time.time() - start_time
     minutes = int(elapsed_time // 60)
     seconds = int(elapsed_time % 60)
 
-    print("\nFinal Research Report:")
-    print("=====================")
-    print(final_report)
+    if not args.stream:
+        print("\nFinal Research Report:")
+        print("=====================")
+        print(final_report)
     print(f"\nTotal research time: {minutes} minutes and {seconds} seconds")
-
-    # Save the report to a file
+    print(f"Budget usage: {json.dumps(results['budget'])}")
+    print(f"Coalesced requests: {deep_search.metrics.counters['coalesced_requests']}")
+    print(f"Retried calls: {deep_search.metrics.counters['retries']}, "
+          f"failed research nodes: {deep_search.metrics.counters['failed_nodes']}")
+    latency = deep_search.metrics.latency_summary("latency_grounded_search")
+    print(f"Search latency: p50 {latency['p50']}s, p95 {latency['p95']}s, p99 {latency['p99']}s "
+          f"({latency['count']} calls)")
+    if args.hedge:
+        print(f"Hedged searches: {deep_search.metrics.counters['hedged_grounded_search']} "
+              f"({deep_search.metrics.counters['hedge_wins_grounded_search']} answered by the hedge)")
+    if len(deep_search.key_pool) > 1:
+        for label in deep_search.key_pool.labels:
+            print(f"API {label}: {deep_search.metrics.counters[f'key_calls_{label}']} calls, "
+                  f"{deep_search.metrics.counters[f'key_tokens_{label}']} tokens, "
+                  f"{deep_search.metrics.counters[f'key_rate_limit_errors_{label}']} quota errors")
+
+    # Save the report to a file (with citations and sources when streamed)
     with open("final_report.md", "w") as f:
         f.write(final_report)
         f.write(
-            f"\n\nTotal research time: {minutes} minutes and {seconds} seconds")
\ No newline at end of file
+            f"\n\nTotal research time: {minutes} minutes and {seconds} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Run deep search queries',
+        epilog='Requests are not throttled client-side unless GEMINI_RPM / GEMINI_TPM are set '
+               '(requests / tokens per minute and per API key, e.g. 15 / 1000000 on the free tier); '
+               'quota errors are always retried with backoff.')
+    parser.add_argument('query', type=str, nargs='?', help='The search query')
+    parser.add_argument('--mode', type=str, choices=['fast', 'balanced', 'comprehensive'],
+                        default='balanced', help='Research mode (default: balanced)')
+    parser.add_argument('--num-queries', type=int, default=3,
+                        help='Number of queries to generate (default: 3)')
+    parser.add_argument('--learnings', nargs='*', default=[],
+                        help='List of previous learnings')
+    parser.add_argument('--memo', type=str, choices=['use', 'bypass', 'cache_only'],
+                        default='use',
+                        help='Reuse memoized LLM stages (use), ignore them (bypass) '
+                             'or replay without API calls (cache_only) (default: use)')
+    parser.add_argument('--max-calls', type=int, default=None,
+                        help='Maximum number of Gemini calls for the research phase')
+    parser.add_argument('--max-input-tokens', type=int, default=None,
+                        help='Maximum input tokens for the research phase')
+    parser.add_argument('--max-output-tokens', type=int, default=None,
+                        help='Maximum output tokens for the research phase')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='Wall-clock budget in seconds for the research phase')
+    parser.add_argument('--report-strategy', type=str, choices=['sections', 'single'],
+                        default='sections',
+                        help='Write the report section by section in parallel from an outline '
+                             '(sections) or in one generation (single) (default: sections)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the final report to the console and final_report.md')
+
+    parser.add_argument('--speculate', type=int, default=0, metavar='N',
+                        help='Prefetch up to N likely next-level searches per run (default: 0, off)')
+    parser.add_argument('--pipeline', type=str, choices=['fused', 'two_step'], default=None,
+                        help='One grounded call per sub-query returning learnings (fused) or a '
+                             'search then an extraction call (two_step) (default: per mode)')
+    parser.add_argument('--batch-window', type=float, default=EXTRACTION_BATCH_WINDOW, metavar='SECONDS',
+                        help='Extract learnings of search results finishing within this window in one call '
+                             f'(default: {EXTRACTION_BATCH_WINDOW}, 0 to disable)')
+    parser.add_argument('--hedge', type=float, default=None, metavar='PERCENTILE',
+                        help='Send a duplicate of grounded searches still unanswered at this latency '
+                             'percentile, e.g. 95 (default: off)')
+    parser.add_argument('--resume', type=str, default=None, metavar='RUN_ID',
+                        help='Resume an interrupted research run from its checkpoint')
+
+    args = parser.parse_args()
+    if not args.query and not args.resume:
+        parser.error("a query is required unless --resume is given")
+    args.run_id = args.resume or new_run_id()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Resume with: python main.py --resume {args.run_id}")
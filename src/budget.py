@@ -0,0 +1,86 @@
+import math
+import time
+
+
+class ResearchBudget:
+    """
+    Hard limits for one research run: Gemini calls, input/output tokens
+    (as reported by usage_metadata) and wall-clock time. The scheduler asks
+    how many more nodes fit before expanding a level, so a run stops
+    growing before a limit is crossed and keeps what it gathered so far.
+    Any limit left to None is not enforced but its usage is still tracked.
+    """
+
+    def __init__(self, max_calls: int = None, max_input_tokens: int = None,
+                 max_output_tokens: int = None, deadline: float = None):
+        self.max_calls = max_calls
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.deadline = deadline
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.started_at = time.monotonic()
+        self.level_seconds = []
+        self.stopped_reason = None
+
+    def record(self, response=None):
+        """Account for one Gemini request; response is None for one sent but never answered (a cancelled hedge)"""
+        self.calls += 1
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.input_tokens += getattr(usage, "prompt_token_count", None) or 0
+            self.output_tokens += getattr(usage, "candidates_token_count", None) or 0
+
+    def record_level(self, seconds: float):
+        self.level_seconds.append(seconds)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining_nodes(self, calls_per_node: float, reserved_calls: int = 0) -> tuple[float, str]:
+        """
+        How many more research nodes fit in the remaining budget, based on
+        the average cost of the calls made so far, and which budget is the
+        binding one (None when nothing is limited). reserved_calls are
+        spent first, by calls about to be made besides the nodes.
+        """
+        limits = {}
+        if self.max_calls is not None:
+            limits["calls"] = math.floor((self.max_calls - self.calls - reserved_calls) / calls_per_node)
+
+        per_call = max(self.calls, 1)
+        if self.max_input_tokens is not None and self.input_tokens:
+            per_node = self.input_tokens / per_call * calls_per_node
+            limits["input_tokens"] = math.floor((self.max_input_tokens - self.input_tokens) / per_node)
+        if self.max_output_tokens is not None and self.output_tokens:
+            per_node = self.output_tokens / per_call * calls_per_node
+            limits["output_tokens"] = math.floor((self.max_output_tokens - self.output_tokens) / per_node)
+
+        if self.deadline is not None:
+            # Another level only starts if it is expected to end in time
+            expected = max(self.level_seconds) if self.level_seconds else 0.0
+            if self.elapsed() + expected >= self.deadline:
+                limits["deadline"] = 0
+
+        if not limits:
+            return math.inf, None
+        reason, nodes = min(limits.items(), key=lambda item: item[1])
+        return max(nodes, 0), reason
+
+    def report(self) -> dict:
+        """Consumption of each budget, for the research summary"""
+        def usage(used, limit):
+            return {
+                "used": used,
+                "limit": limit,
+                "consumed": round(used / limit, 3) if limit else None
+            }
+
+        return {
+            "calls": usage(self.calls, self.max_calls),
+            "input_tokens": usage(self.input_tokens, self.max_input_tokens),
+            "output_tokens": usage(self.output_tokens, self.max_output_tokens),
+            "seconds": usage(round(self.elapsed(), 1), self.deadline),
+            "stopped_reason": self.stopped_reason
+        }
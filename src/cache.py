@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+
+# Mirrors PathManager.BASE_DIR in ui/ui_core.py
+DEFAULT_CACHE_DIR = Path("results") / "cache"
+
+# Seconds to wait on a database locked by another process before giving up
+BUSY_TIMEOUT = 2.0
+
+
+class CacheMissError(LookupError):
+    """Raised in cache-only mode when a result would require an API call"""
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive form of a query used in cache keys"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def make_key(*parts: Any) -> str:
+    """Stable hash of arbitrary JSON-serializable parts (configs are repr'd)"""
+    payload = json.dumps(parts, sort_keys=True, default=repr, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PersistentCache:
+    """
+    SQLite-backed key/value cache fronted by an in-memory LRU.
+
+    Values are stored as JSON with a per-entry expiry. The database runs in
+    WAL mode with a short busy timeout so several processes can share one
+    file; a database still locked past it reads as a miss and skips the
+    write. When the namespace grows beyond max_bytes, the least recently
+    accessed entries are evicted. Async callers use aget() / aput(), which
+    keep SQLite off the event loop.
+    """
+
+    def __init__(self, path: Path, namespace: str, default_ttl: float = 7 * 24 * 3600,
+                 max_bytes: int = 64 * 1024 * 1024, memory_entries: int = 512, metrics=None):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.metrics = metrics
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed_at)")
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.metrics:
+            self.metrics.increment(f"{self.namespace}_cache_{'hits' if hit else 'misses'}")
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        """Cached value or None when missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._count(True)
+                    return entry[1]
+                del self._memory[key]
+
+            try:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                        (now, self.namespace, key)
+                    )
+            except sqlite3.OperationalError as e:
+                self._busy(e)
+                row = None
+            if row is None:
+                self._count(False)
+                return None
+
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self._count(True)
+            return value
+
+    def put(self, key: str, value: Any, ttl: float = None):
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, size, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, data, len(data), expires_at, now)
+                )
+                self._evict(now)
+            except sqlite3.OperationalError as e:
+                self._busy(e)
+
+    async def aget(self, key: str) -> Any:
+        """get() run in a worker thread"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: Any, ttl: float = None):
+        """put() run in a worker thread"""
+        await asyncio.to_thread(self.put, key, value, ttl)
+
+    def _busy(self, error: sqlite3.OperationalError):
+        """A database locked past BUSY_TIMEOUT only costs a cache miss or an unsaved entry"""
+        if "locked" not in str(error) and "busy" not in str(error):
+            raise error
+        if self.metrics:
+            self.metrics.increment(f"{self.namespace}_cache_busy")
+
+    def _evict(self, now: float):
+        self._db.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently accessed entries until back under budget
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._db.execute(
+                "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at", (self.namespace,)):
+            victims.append((self.namespace, key))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", victims)
+        for _, key in victims:
+            self._memory.pop(key, None)
+        if self.metrics:
+            self.metrics.increment(f"{self.namespace}_cache_evictions", len(victims))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
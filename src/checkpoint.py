@@ -0,0 +1,99 @@
+import json
+import time
+import uuid
+from pathlib import Path
+
+from .tree_journal import atomic_write_json
+
+DEFAULT_CHECKPOINT_DIR = Path("results") / "checkpoints"
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:6]
+
+
+def _int_keys(urls: dict) -> dict:
+    # JSON turned the integer source indices into strings
+    return {int(i): url for i, url in urls.items()}
+
+
+class ResearchCheckpoint:
+    """
+    Crash-safe record of one research run, so it can be resumed by id.
+
+    <run_id>.json holds the run parameters and the frontier of sub-queries
+    still to research; it is replaced atomically at every level boundary.
+    <run_id>.results.jsonl gets one line per finished node (its learnings,
+    follow-up questions and sources) as soon as the node completes, so
+    work done inside an interrupted level is not lost either.
+    """
+
+    def __init__(self, run_id: str, directory=None):
+        self.run_id = run_id
+        self.directory = Path(directory) if directory else DEFAULT_CHECKPOINT_DIR
+        self.state_path = self.directory / f"{run_id}.json"
+        self.results_path = self.directory / f"{run_id}.results.jsonl"
+        self.state = None
+        self._results_file = None
+
+    def exists(self) -> bool:
+        return self.state_path.exists()
+
+    def load(self) -> dict:
+        """Saved state, with the recorded node results under "results" """
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            self.state = json.load(f)
+        self.state["visited_urls"] = _int_keys(self.state.get("visited_urls", {}))
+
+        results = []
+        if self.results_path.exists():
+            with open(self.results_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # A line cut short by a crash is simply not recorded
+                    if not line.endswith("\n"):
+                        break
+                    result = json.loads(line)
+                    result["visited_urls"] = _int_keys(result["visited_urls"])
+                    results.append(result)
+        return {**self.state, "results": results}
+
+    def start(self, params: dict):
+        """Begin a new run with the given parameters (query, breadth, depth, ...)"""
+        self.state = {
+            "run_id": self.run_id,
+            "status": "running",
+            "frontier": None,
+            **params
+        }
+        self._write_state()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._results_file = open(self.results_path, "w", encoding="utf-8")
+
+    def resume(self):
+        """Continue appending to a loaded run"""
+        self.state["status"] = "running"
+        self._write_state()
+        self._results_file = open(self.results_path, "a", encoding="utf-8")
+
+    def save_frontier(self, frontier: list[dict]):
+        self.state["frontier"] = frontier
+        self._write_state()
+
+    def record_result(self, result: dict):
+        self._results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._results_file.flush()
+
+    def finish(self):
+        self.state["status"] = "completed"
+        self.state["frontier"] = []
+        self._write_state()
+        self.close()
+
+    def close(self):
+        if self._results_file is not None:
+            self._results_file.close()
+            self._results_file = None
+
+    def _write_state(self):
+        self.state["updated_at"] = time.time()
+        atomic_write_json(self.state_path, self.state, ensure_ascii=False)
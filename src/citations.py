@@ -0,0 +1,120 @@
+import re
+from typing import Any
+
+# "[2]" or "[1, 3]" but not a Markdown link label such as "[2](https://...)"
+CITATION_PATTERN = re.compile(r"( ?)\[(\d+(?:\s*,\s*\d+)*)\](?!\()")
+
+
+class CitationRenumberer:
+    """
+    Rewrites section-local citations into one global numbering.
+
+    Each report section is written against its own short source list and
+    cites it as [1], [2], ... apply() maps those local numbers to source
+    ids and numbers sources globally in order of first citation, so
+    sections must be applied in report order. Citations pointing outside
+    the section's source list are dropped.
+    """
+
+    def __init__(self):
+        self.numbers = {}  # source id -> global citation number
+
+    def apply(self, text: str, local_sources: list) -> str:
+        def replace(match):
+            cited = []
+            for local in match.group(2).split(","):
+                local = int(local)
+                if not 1 <= local <= len(local_sources):
+                    continue
+                number = self.numbers.setdefault(local_sources[local - 1], len(self.numbers) + 1)
+                if number not in cited:
+                    cited.append(number)
+            if not cited:
+                return ""
+            return match.group(1) + "[" + ", ".join(str(number) for number in cited) + "]"
+
+        return CITATION_PATTERN.sub(replace, text)
+
+    @property
+    def order(self) -> list:
+        """Cited source ids, by global citation number"""
+        return sorted(self.numbers, key=self.numbers.get)
+
+
+def _field(obj: Any, name: str, default=None):
+    """Read a field from an SDK object (google.genai / proto-plus) or a plain dict"""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        value = obj.get(name, default)
+    else:
+        value = getattr(obj, name, default)
+    return default if value is None else value
+
+
+def grounding_sources(grounding_chunks) -> dict[int, dict]:
+    """Map grounding chunk index -> {"link", "title"} for web chunks"""
+    sources = {}
+    for i, chunk in enumerate(grounding_chunks):
+        web = _field(chunk, "web")
+        if web:
+            sources[i] = {"link": _field(web, "uri", ""), "title": _field(web, "title", "")}
+    return sources
+
+
+def splice_citations(response: Any, answer: str) -> tuple[str, dict[int, dict]]:
+    """
+    Insert grounding citations into answer, reading the grounding metadata
+    straight from the response (a google.genai or google.generativeai
+    response, or their dict form) instead of serializing it first.
+
+    Segment offsets are UTF-8 byte offsets, so the splice works on the
+    encoded answer; this keeps citations in place with accented text. A
+    support citing several chunks gets one citation per distinct chunk.
+    Returns (formatted_text, sources) where sources maps chunk index to
+    {"link", "title"}.
+    """
+    candidates = _field(response, "candidates", [])
+    if not candidates:
+        return answer, {}
+    metadata = _field(candidates[0], "grounding_metadata")
+    grounding_chunks = _field(metadata, "grounding_chunks", [])
+    grounding_supports = _field(metadata, "grounding_supports", [])
+    if not grounding_chunks or not grounding_supports:
+        return answer, {}
+
+    sources = grounding_sources(grounding_chunks)
+    labels = {source_idx: f"[[{source_idx + 1}]]({source['link']})" for source_idx, source in sources.items()}
+    data = answer.encode("utf-8")
+    size = len(data)
+    # Same accessor for SDK objects and dicts; picked once, off the hot loop
+    get = dict.get if isinstance(grounding_supports[0], dict) else getattr
+
+    # end offset -> chunk indices cited there, in order of appearance
+    cited_at = {}
+    for support in grounding_supports:
+        segment = get(support, "segment", None)
+        end_index = get(segment, "end_index", None) if segment else None
+        if end_index is None:
+            continue
+        end_index = min(max(int(end_index), 0), size)
+        # Never split a multi-byte character
+        while end_index < size and data[end_index] & 0xC0 == 0x80:
+            end_index += 1
+        indices = cited_at.setdefault(end_index, [])
+        for source_idx in get(support, "grounding_chunk_indices", None) or ():
+            if source_idx in labels and source_idx not in indices:
+                indices.append(source_idx)
+
+    fragments = []
+    last_pos = 0
+    for pos in sorted(cited_at):
+        indices = cited_at[pos]
+        if not indices:
+            continue
+        fragments.append(data[last_pos:pos])
+        fragments.append("".join([labels[source_idx] for source_idx in indices]).encode("utf-8"))
+        last_pos = pos
+    fragments.append(data[last_pos:])
+
+    return b"".join(fragments).decode("utf-8"), sources
@@ -1,28 +1,58 @@
 from typing import Callable, List, TypeVar, Any
 import asyncio
+import contextlib
 import datetime
 import json
-import os
+import logging
 import uuid
 
 import math
+import time
+from pathlib import Path
 
 from dotenv import load_dotenv
-from google.genai import types
 
-import google.generativeai as genai
+from .budget import ResearchBudget
+from .cache import DEFAULT_CACHE_DIR, CacheMissError, PersistentCache, make_key, normalize_query
+from .checkpoint import ResearchCheckpoint, new_run_id
+from .citations import CitationRenumberer, splice_citations
+from .extraction_batcher import EXTRACTION_BATCH_SIZE, EXTRACTION_BATCH_WINDOW, ExtractionBatcher
+from .gemini_gateway import GeminiGateway
+from .hedging import HedgePolicy
+from .key_pool import KeyPool
+from .learning_dedup import cluster_learnings
+from .metrics import RunMetrics
+from .progress_events import (
+    LEARNING_ADDED, QUERY_COMPLETED, QUERY_STARTED, SOURCES_ADDED, ProgressBus, ProgressEvent
+)
+from .query_index import DISTINCT_THRESHOLD, DUPLICATE_THRESHOLD, QueryIndex
+from .rate_limiter import RateLimiter
+from .retry import RetryEngine, RetryPolicy
+from .single_flight import IN_FLIGHT, SingleFlight
+from .tree_journal import TreeJournal, TreeSnapshotWriter
 
-from google import genai as genai_client
 
-from google.ai.generativelanguage_v1beta.types import content
+class ResearchProgress:
+    """
+    Research tree state, indexed for constant-time updates.
 
+    Every query is a node record keyed by a stable id, holding its depth,
+    parent id, child ids and the number of children still running, so
+    completing a node and propagating completion to its ancestors never
+    scans the tree. queries_by_depth and query_parents are kept as views
+    over the same records for existing readers.
 
-class ResearchProgress:
-    def __init__(self, depth: int, breadth: int):
+    Every change is published as a ProgressEvent on events (a ProgressBus),
+    at constant cost per change.
+    """
+
+    def __init__(self, depth: int, breadth: int, events: ProgressBus = None):
         self.total_depth = depth
         self.total_breadth = breadth
         self.current_depth = depth
         self.current_breadth = 0
+        self.nodes = {}  # id -> node record
+        self.node_ids = {}  # (query, depth) -> id
         self.queries_by_depth = {}
         self.query_order = []  # Track order of queries
         self.query_parents = {}  # Track parent-child relationships
@@ -30,143 +60,400 @@ class ResearchProgress:
         self.completed_queries = 0
         self.query_ids = {}  # Store persistent IDs for queries
         self.root_query = None  # Store the root query
+        self.root_id = None
+        self.events = events
+
+    def _node(self, query: str, depth: int = None) -> dict:
+        """Node record of query at depth, or of its first occurrence when depth is None"""
+        node_id = self.node_ids.get((query, depth)) if depth is not None else self.query_ids.get(query)
+        return self.nodes.get(node_id)
 
     def start_query(self, query: str, depth: int, parent_query: str = None):
         """Record the start of a new query"""
         if depth not in self.queries_by_depth:
             self.queries_by_depth[depth] = {}
 
-        if query not in self.queries_by_depth[depth]:
-            # Generate ID only once per query
-            if query not in self.query_ids:
-                self.query_ids[query] = str(uuid.uuid4())
-                
-            self.queries_by_depth[depth][query] = {
+        if (query, depth) not in self.node_ids:
+            # Generate ID only once per query; a repeat at another depth gets its own node
+            node_id = self.query_ids.setdefault(query, str(uuid.uuid4()))
+            if node_id in self.nodes:
+                node_id = str(uuid.uuid4())
+            parent = self._node(parent_query) if parent_query else None
+
+            node = {
+                "id": node_id,
+                "query": query,
+                "depth": depth,
+                "parent_id": parent["id"] if parent else None,
+                "children": [],
+                "pending_children": 0,
                 "completed": False,
-                "learnings": [],
-                "id": self.query_ids[query]  # Use persistent ID
+                "learnings": []
             }
+            self.nodes[node_id] = node
+            self.node_ids[(query, depth)] = node_id
+            self.queries_by_depth[depth][query] = node
             self.query_order.append(query)
             if parent_query:
                 self.query_parents[query] = parent_query
+                if parent:
+                    parent["children"].append(node_id)
+                    parent["pending_children"] += 1
             else:
                 self.root_query = query  # Set as root if no parent
+                self.root_id = node_id
             self.total_queries += 1
 
         self.current_depth = depth
         self.current_breadth = len(self.queries_by_depth[depth])
-        self._report_progress(f"Starting query: {query}")
+        self._publish(QUERY_STARTED, self.nodes[self.node_ids[(query, depth)]])
 
     def add_learning(self, query: str, depth: int, learning: str):
         """Record a learning for a specific query"""
-        if depth in self.queries_by_depth and query in self.queries_by_depth[depth]:
-            if learning not in self.queries_by_depth[depth][query]["learnings"]:
-                self.queries_by_depth[depth][query]["learnings"].append(learning)
-                self._report_progress(f"Added learning for query: {query}")
+        node = self._node(query, depth)
+        if node and learning not in node["learnings"]:
+            node["learnings"].append(learning)
+            self._publish(LEARNING_ADDED, node, learning=learning)
+
+    def add_sources(self, query: str, depth: int, sources: dict[int, dict]):
+        """Record the sources a query's search returned"""
+        node = self._node(query, depth)
+        if node and sources:
+            self._publish(SOURCES_ADDED, node, sources=sources)
 
     def complete_query(self, query: str, depth: int):
-        """Mark a query as completed"""
-        if depth in self.queries_by_depth and query in self.queries_by_depth[depth]:
-            if not self.queries_by_depth[depth][query]["completed"]:
-                self.queries_by_depth[depth][query]["completed"] = True
-                self.completed_queries += 1
-                self._report_progress(f"Completed query: {query}")
-
-                # Check if parent query exists and update its status if all children are complete
-                parent_query = self.query_parents.get(query)
-                if parent_query:
-                    self._update_parent_status(parent_query)
+        """Mark a query as completed, then any ancestor whose children are now all complete"""
+        node = self._node(query, depth)
+        while node and not node["completed"]:
+            node["completed"] = True
+            self.completed_queries += 1
+            self._publish(QUERY_COMPLETED, node)
+
+            parent = self.nodes.get(node["parent_id"])
+            if not parent:
+                break
+            parent["pending_children"] -= 1
+            if parent["pending_children"] > 0:
+                break
+            node = parent
 
     def _update_parent_status(self, parent_query: str):
         """Update parent query status based on children completion"""
-        # Find all children of this parent
-        children = [q for q, p in self.query_parents.items() if p == parent_query]
-        
-        # Check if all children are complete
-        parent_depth = next((d for d, queries in self.queries_by_depth.items() 
-                           if parent_query in queries), None)
-        
-        if parent_depth is not None:
-            all_children_complete = all(
-                self.queries_by_depth[d][q]["completed"]
-                for q in children
-                for d in self.queries_by_depth
-                if q in self.queries_by_depth[d]
-            )
-            
-            if all_children_complete:
-                # Complete the parent query
-                self.complete_query(parent_query, parent_depth)
-
-    def _report_progress(self, action: str):
-        """Report current progress"""
-        print(f"\nResearch Progress Update:")
-        print(f"Action: {action}")
-
-        # Build and print the tree starting from the root query
-        if self.root_query:
-            tree = self._build_research_tree()
-            print("\nQuery Tree Structure:")
-            print(json.dumps(tree, indent=2))
-
-        print(f"\nOverall Progress: {self.completed_queries}/{self.total_queries} queries completed")
-        print("")
+        parent = self._node(parent_query)
+        if parent and parent["pending_children"] == 0:
+            self.complete_query(parent["query"], parent["depth"])
+
+    def _publish(self, event_type: str, node: dict, **fields):
+        if self.events is None:
+            return
+        parent = self.nodes.get(node["parent_id"])
+        self.events.publish(ProgressEvent(
+            type=event_type,
+            node_id=node["id"],
+            query=node["query"],
+            depth=node["depth"],
+            parent_id=node["parent_id"],
+            parent_query=parent["query"] if parent else None,
+            completed=self.completed_queries,
+            total=self.total_queries,
+            **fields
+        ))
 
     def _build_research_tree(self):
         """Build the full research tree structure"""
-        def build_node(query):
-            """Recursively build the tree node"""
-            # Find the depth for this query
-            depth = next((d for d, queries in self.queries_by_depth.items() 
-                         if query in queries), 0)
-            
-            data = self.queries_by_depth[depth][query]
-            
-            # Find all children of this query
-            children = [q for q, p in self.query_parents.items() if p == query]
-            
-            return {
-                "query": query,
-                "id": self.query_ids[query],
-                "status": "completed" if data["completed"] else "in_progress",
-                "depth": depth,
-                "learnings": data["learnings"],
-                "sub_queries": [build_node(child) for child in children],
-                "parent_query": self.query_parents.get(query)
+        if self.root_id is None:
+            return {}
+
+        # One pass to create every tree node, children in start order; no recursion
+        tree_nodes = {}
+        for node_id, node in self.nodes.items():
+            parent = self.nodes.get(node["parent_id"])
+            tree_nodes[node_id] = {
+                "query": node["query"],
+                "id": node_id,
+                "status": "completed" if node["completed"] else "in_progress",
+                "depth": node["depth"],
+                "learnings": node["learnings"],
+                "sub_queries": [],
+                "parent_query": parent["query"] if parent else None
             }
 
-        # Start building from the root query
-        if self.root_query:
-            return build_node(self.root_query)
-        return {}
+        stack = [self.root_id]
+        while stack:
+            node_id = stack.pop()
+            children = self.nodes[node_id]["children"]
+            tree_nodes[node_id]["sub_queries"] = [tree_nodes[child] for child in children]
+            stack.extend(children)
+        return tree_nodes[self.root_id]
 
     def get_learnings_by_query(self):
         """Get all learnings organized by query"""
         learnings = {}
-        for depth, queries in self.queries_by_depth.items():
-            for query, data in queries.items():
-                if data["learnings"]:
-                    learnings[query] = data["learnings"]
+        for node in self.nodes.values():
+            if node["learnings"]:
+                learnings[node["query"]] = node["learnings"]
         return learnings
 
 
 load_dotenv()
 
+logger = logging.getLogger("deep_research")
+
+MEMO_MODES = ("use", "bypass", "cache_only")
+
+# Per-mode scheduling of the research tree:
+# - max_queries: SERP queries generated for the first level
+# - follow_ups_per_node: follow-up questions expanded into the next level
+# - max_concurrency: sub-queries in flight at once across all branches
+# - pipeline: "two_step" (grounded search, then a structured extraction
+#   call) or "fused" (one grounded call returning both)
+MODE_SETTINGS = {
+    "fast": {"max_queries": 3, "follow_ups_per_node": 1, "max_concurrency": 8, "pipeline": "fused"},
+    "balanced": {"max_queries": 7, "follow_ups_per_node": 1, "max_concurrency": 7, "pipeline": "fused"},
+    "comprehensive": {"max_queries": 5, "follow_ups_per_node": 2, "max_concurrency": 5, "pipeline": "two_step"},
+}
+PIPELINES = ("two_step", "fused")
+
+# Gemini calls per research node (grounded search + learning extraction),
+# used to translate the remaining budget into schedulable nodes
+CALLS_PER_NODE = 2
+
+# Hierarchical report synthesis: above REPORT_CONDENSE_THRESHOLD learnings,
+# groups of at most REPORT_FAN_IN items are condensed in parallel, round
+# after round, until the digests fit in a single final-report prompt
+REPORT_FAN_IN = 8
+REPORT_CONDENSE_THRESHOLD = 60
+
+# Final report pipelines: one sequential generation, or an outline whose
+# sections are written concurrently and stitched together
+REPORT_STRATEGIES = ("single", "sections")
+REPORT_WORDS = 3000
+
+
 class DeepSearch:
-    def __init__(self, api_key: str, mode: str = "balanced"):
+    def __init__(self, api_key: str, mode: str = "balanced", rate_limits: dict[str, dict] = None,
+                 cache_dir: str = None, search_cache_ttl: float = 7 * 24 * 3600,
+                 memo_ttl: float = 30 * 24 * 3600, memo_mode: str = "use",
+                 max_concurrency: int = None, report_fan_in: int = REPORT_FAN_IN,
+                 report_condense_threshold: int = REPORT_CONDENSE_THRESHOLD,
+                 report_strategy: str = "sections", tree_path: str = "research_tree.json",
+                 journal_path: str = "research_journal.jsonl", checkpoint_dir: str = None,
+                 speculative_searches: int = 0, pipeline: str = None,
+                 extraction_batch_window: float = EXTRACTION_BATCH_WINDOW,
+                 extraction_batch_size: int = EXTRACTION_BATCH_SIZE,
+                 single_flight: SingleFlight = None, hedge: dict[str, float] = None,
+                 timeouts: dict[str, float] = None, retry_policy: RetryPolicy = None,
+                 api_keys: list[str] = None):
         """
         Initialize DeepSearch with a mode parameter:
         - "fast": Prioritizes speed (reduced breadth/depth, highest concurrency)
         - "balanced": Default balance of speed and comprehensiveness
         - "comprehensive": Maximum detail and coverage
+
+        rate_limits maps a model name to {"rpm": ..., "tpm": ...} budgets,
+        e.g. {"gemini-2.0-flash": {"rpm": 2000, "tpm": 4_000_000}}. Models
+        without one are not throttled (GEMINI_RPM / GEMINI_TPM set a default),
+        only backed off after a quota error.
+
+        Grounded search results are cached on disk under cache_dir (defaults
+        to results/cache) for search_cache_ttl seconds; pass 0 to disable.
+        Structured stages (planning, follow-up questions, SERP queries,
+        learning extraction) are memoized on (prompt, model, config) for
+        memo_ttl seconds. memo_mode is one of:
+        - "use": read and write the memo (default)
+        - "bypass": always call the API, refreshing the memo
+        - "cache_only": never call the API, raise CacheMissError on a miss
+
+        max_concurrency caps the sub-queries in flight at once (defaults to
+        the mode's setting in MODE_SETTINGS).
+
+        Final reports over more than report_condense_threshold learnings are
+        synthesized map-reduce style, condensing report_fan_in items per call.
+        report_strategy is "sections" (outline first, sections written in
+        parallel) or "single" (one sequential generation).
+
+        tree_path and journal_path receive the research tree snapshot and the
+        progress journal of each run; pass None to skip either. Runs are
+        checkpointed under checkpoint_dir (defaults to results/checkpoints).
+
+        speculative_searches > 0 prefetches the grounded search of likely
+        next-level queries as soon as a node yields its follow-up questions,
+        instead of waiting for the whole level; at most that many prefetches
+        are started per run, and those the next level does not pick are
+        cancelled.
+
+        pipeline overrides the mode's research-node pipeline ("two_step" or
+        "fused", see MODE_SETTINGS).
+
+        Search results finishing within extraction_batch_window seconds of
+        each other have their learnings extracted in one call, up to
+        extraction_batch_size results per call; pass 0 to extract each
+        result on its own.
+
+        Identical searches and structured stages in flight at the same time
+        are sent once; single_flight defaults to the process-wide registry,
+        so concurrent DeepSearch instances share their requests too.
+
+        hedge opts call types into hedged requests: it maps a generation
+        profile (e.g. "grounded_search") to the latency percentile after
+        which a still unanswered call is sent a second time.
+
+        timeouts overrides the per-request timeouts of the generation
+        profiles (see CALL_TIMEOUTS); a request that times out fails like
+        any other, so its research node ends without learnings.
+
+        Transient failures (timeouts, connection errors, 5xx) are retried
+        following retry_policy (jittered exponential backoff, see
+        RetryPolicy) behind a circuit breaker per model and endpoint;
+        deterministic ones (4xx) are cached for a minute so identical
+        requests fail fast. Retries are counted in the metrics.
+
+        api_keys adds further Gemini API keys (see load_api_keys): each key
+        gets its own rate_limits budget and every request goes to the key
+        with the most headroom, a key hitting its quota being cooled down
+        while the others carry on. Calls, tokens and quota errors are
+        counted per key (key_calls_key1, ...).
         """
         self.api_key = api_key
+        self.key_pool = KeyPool([api_key, *(api_keys or [])])
         self.model_name = "gemini-2.0-flash"
         self.query_history = set()
+        self.query_index = QueryIndex()
         self.mode = mode
-        genai.configure(api_key=self.api_key)
+        self.max_concurrency = max_concurrency or MODE_SETTINGS[mode]["max_concurrency"]
+        if report_fan_in < 2:
+            raise ValueError("report_fan_in must be at least 2")
+        self.report_fan_in = report_fan_in
+        if report_condense_threshold < 1:
+            raise ValueError("report_condense_threshold must be at least 1")
+        self.report_condense_threshold = report_condense_threshold
+        if report_strategy not in REPORT_STRATEGIES:
+            raise ValueError(f"report_strategy must be one of {REPORT_STRATEGIES}")
+        self.report_strategy = report_strategy
+        self.tree_path = tree_path
+        self.journal_path = journal_path
+        self.checkpoint_dir = checkpoint_dir
+        self.speculative_searches = speculative_searches
+        self.pipeline = pipeline or MODE_SETTINGS[mode]["pipeline"]
+        if self.pipeline not in PIPELINES:
+            raise ValueError(f"pipeline must be one of {PIPELINES}")
+        self.extraction_batcher = None
+        self.single_flight = single_flight or IN_FLIGHT
+        self._speculation = {}  # normalized query -> prefetch task
+        self._speculation_left = 0
+        self._prefetching = set()  # keys of the prefetches holding a node slot
+        self._node_slots = None  # max_concurrency semaphore of the run in progress
+        self.metrics = RunMetrics()
+        # Research tree progress; subscribe UIs, loggers, etc. with events.subscribe(callback)
+        self.events = ProgressBus()
+        self.events.subscribe(self._count_event)
+        self.rate_limiter = RateLimiter(rate_limits, metrics=self.metrics, keys=self.key_pool.labels)
+        self.gateway = GeminiGateway(
+            self.api_key, rate_limiter=self.rate_limiter, metrics=self.metrics, key_pool=self.key_pool,
+            hedge_policies={profile: HedgePolicy(p) for profile, p in (hedge or {}).items()},
+            timeouts=timeouts,
+            retry=RetryEngine(retry_policy, metrics=self.metrics)
+        )
+        self._scope = None  # asyncio.Timeout around the levels of the run in progress
+        self._cancel_requested = False
+        if extraction_batch_window and extraction_batch_size > 1:
+            self.extraction_batcher = ExtractionBatcher(
+                self.process_results_batch,
+                lambda item: self.process_result(**item),
+                window=extraction_batch_window,
+                max_batch=extraction_batch_size,
+                metrics=self.metrics
+            )
 
-    def determine_research_breadth_and_depth(self, query: str):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.search_cache = None
+        if search_cache_ttl:
+            self.search_cache = PersistentCache(
+                self.cache_dir / "deep_research_cache.sqlite3",
+                namespace="search",
+                default_ttl=search_cache_ttl,
+                metrics=self.metrics
+            )
+
+        if memo_mode not in MEMO_MODES:
+            raise ValueError(f"memo_mode must be one of {MEMO_MODES}")
+        self.memo_mode = memo_mode
+        self.stage_cache = None
+        if memo_ttl:
+            self.stage_cache = PersistentCache(
+                self.cache_dir / "deep_research_cache.sqlite3",
+                namespace="stage",
+                default_ttl=memo_ttl,
+                metrics=self.metrics
+            )
+
+    async def close(self):
+        """Release the pooled Gemini connections and cache handles"""
+        await self.events.aclose()
+        if self.extraction_batcher:
+            await self.extraction_batcher.aclose()
+        await self.gateway.aclose()
+        for cache in (self.search_cache, self.stage_cache):
+            if cache:
+                cache.close()
+
+    def cancel(self):
+        """
+        Stop the research run in progress: every node still in flight is
+        cancelled and deep_research returns what was gathered so far, with
+        "cancelled" as the budget's stopped_reason. The checkpoint is left
+        resumable. Must be called from the event loop of the run.
+        """
+        self._cancel_requested = True
+        if self._scope is not None and not self._scope.expired():
+            self._scope.reschedule(asyncio.get_running_loop().time())
+
+    @property
+    def calls_per_node(self) -> float:
+        """
+        Expected Gemini calls per research node, for the budget. A fused node
+        costs a second call when its answer has no usable extraction; the
+        fallback rate is smoothed as (fallbacks + 1) / (nodes + 1), so the
+        estimate starts at CALLS_PER_NODE and drops as fused answers succeed.
+        """
+        if self.pipeline != "fused":
+            return CALLS_PER_NODE
+        nodes = self.metrics.counters["fused_nodes"]
+        return 1 + (self.metrics.counters["fused_fallbacks"] + 1) / (nodes + 1)
+
+    def _count_event(self, event: ProgressEvent):
+        self.metrics.increment(f"progress_{event.type}")
+
+    def _memo_key(self, profile_name: str, prompt: str) -> str:
+        profile = self.gateway.profiles[profile_name]
+        return make_key(prompt, profile["model"], profile["config"])
+
+    async def _memoized(self, profile_name: str, prompt: str):
+        """Memoized answer of a structured stage, None when missing or bypassed"""
+        if self.stage_cache and self.memo_mode != "bypass":
+            return await self.stage_cache.aget(self._memo_key(profile_name, prompt))
+        return None
+
+    async def _generate_structured(self, profile_name: str, prompt: str) -> dict:
+        """Run a JSON-schema stage, memoized on its prompt, model and config"""
+        key = self._memo_key(profile_name, prompt)
+
+        cached = await self._memoized(profile_name, prompt)
+        if cached is not None:
+            return cached
+        if self.memo_mode == "cache_only":
+            raise CacheMissError(f"No memoized {profile_name} result for this prompt")
+
+        async def fetch():
+            response = await self.gateway.generate(profile_name, prompt)
+            answer = json.loads(response.text)
+            if self.stage_cache:
+                await self.stage_cache.aput(key, answer)
+            return answer
+
+        return await self.single_flight.do(("stage", key), fetch, self.metrics)
+
+    async def determine_research_breadth_and_depth(self, query: str):
         user_prompt = f"""
 		You are a research planning assistant. Your task is to determine the appropriate breadth and depth for researching a topic defined by a user's query. Evaluate the query's complexity and scope, then recommend values on the following scales:
 
@@ -192,35 +479,10 @@ class DeepSearch:
 		<query>{query}</query>
 		"""
 
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-            "response_schema": content.Schema(
-                type=content.Type.OBJECT,
-                enum=[],
-                required=["breadth", "depth", "explanation"],
-                properties={
-                    "breadth": content.Schema(type=content.Type.NUMBER),
-                    "depth": content.Schema(type=content.Type.NUMBER),
-                    "explanation": content.Schema(type=content.Type.STRING),
-                },
-            ),
-        }
-
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config=generation_config,
-        )
-
-        response = model.generate_content(user_prompt)
-        answer = response.text
-
-        return json.loads(answer)
+        return await self._generate_structured("research_plan", user_prompt)
 
-    def generate_follow_up_questions(
+    async def generate_follow_up_questions(
+        self,
         query: str,
         max_questions: int = 3,
     ):
@@ -230,38 +492,11 @@ class DeepSearch:
         Renvoie un maximum de {max_questions} questions, mais n'hésitez pas à en renvoyer moins si la requête d'origine est claire : <query>{query}</query>
 		"""
 
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-            "response_schema": content.Schema(
-                type=content.Type.OBJECT,
-                enum=[],
-                required=["follow_up_queries"],
-                properties={
-                    "follow_up_queries": content.Schema(
-                        type=content.Type.ARRAY,
-                        items=content.Schema(
-                            type=content.Type.STRING,
-                        ),
-                    ),
-                },
-            ),
-        }
+        answer = await self._generate_structured("follow_up_questions", user_prompt)
 
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config=generation_config,
-        )
+        return answer["follow_up_queries"]
 
-        response = model.generate_content(user_prompt)
-        answer = response.text
-
-        return json.loads(answer)["follow_up_queries"]
-
-    def generate_queries(
+    async def generate_queries(
             self,
             query: str,
             num_queries: int = 3,
@@ -274,7 +509,7 @@ class DeepSearch:
         previous_queries_text = ""
         if previous_queries:
             previous_queries_text = "\n\nPreviously asked queries (avoid generating similar ones):\n" + \
-                "\n".join([f"- {q}" for q in previous_queries])
+                "\n".join([f"- {q}" for q in sorted(previous_queries)])
 
         user_prompt = f"""
         Compte tenu de l'invite suivante de l'utilisateur, générez une liste de requêtes SERP pour rechercher le sujet. Renvoie un maximum de {num_queries} requêtes, mais n'hésitez pas à en renvoyer moins si l'invite d'origine est claire.
@@ -289,141 +524,102 @@ class DeepSearch:
         learnings_prompt = "" if not learnings else "Here are some learnings from previous research, use them to generate more specific queries: " + \
             "\n".join(learnings)
 
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_schema": content.Schema(
-                type=content.Type.OBJECT,
-                enum=[],
-                required=["queries"],
-                properties={
-                    "queries": content.Schema(
-                        type=content.Type.ARRAY,
-                        items=content.Schema(
-                            type=content.Type.STRING,
-                        ),
-                    ),
-                },
-            ),
-            "response_mime_type": "application/json",
-        }
-
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config=generation_config,
-        )
-
         # generate a list of queries
-        response = model.generate_content(
+        answer = await self._generate_structured(
+            "serp_queries",
             user_prompt + learnings_prompt
         )
 
-        answer = response.text
-
-        answer_list = json.loads(answer)["queries"]
+        answer_list = answer["queries"]
 
         return answer_list
 
-    def format_text_with_sources(self, response_dict: dict, answer: str):
+    def format_text_with_sources(self, response: Any, answer: str):
         """
         Format text with sources from Gemini response, adding citations at specified positions.
         Returns tuple of (formatted_text, sources_dict).
         """
-        if not response_dict or not response_dict.get('candidates'):
-            return answer, {}
-
-        # Get grounding metadata from the response
-        grounding_metadata = response_dict['candidates'][0].get(
-            'grounding_metadata')
-        if not grounding_metadata:
-            return answer, {}
-
-        # Get grounding chunks and supports
-        grounding_chunks = grounding_metadata.get('grounding_chunks', [])
-        grounding_supports = grounding_metadata.get('grounding_supports', [])
-
-        if not grounding_chunks or not grounding_supports:
-            return answer, {}
-
         try:
-            # Create mapping of URLs
-            sources = {
-                i: {
-                    'link': chunk.get('web', {}).get('uri', ''),
-                    'title': chunk.get('web', {}).get('title', '')
-                }
-                for i, chunk in enumerate(grounding_chunks)
-                if chunk.get('web')
-            }
-
-            # Create a list of (position, citation) tuples
-            citations = []
-            for support in grounding_supports:
-                segment = support.get('segment', {})
-                indices = support.get('grounding_chunk_indices', [])
-
-                if indices and segment and segment.get('end_index') is not None:
-                    end_index = segment['end_index']
-                    source_idx = indices[0]
-                    if source_idx in sources:
-                        citation = f"[[{source_idx + 1}]]({sources[source_idx]['link']})"
-                        citations.append((end_index, citation))
-
-            # Sort citations by position (end_index)
-            citations.sort(key=lambda x: x[0])
-
-            # Insert citations into the text
-            result = ""
-            last_pos = 0
-            for pos, citation in citations:
-                result += answer[last_pos:pos]
-                result += citation
-                last_pos = pos
-
-            # Add any remaining text
-            result += answer[last_pos:]
-
-            return result, sources
-
+            return splice_citations(response, answer)
         except Exception as e:
             print(f"Error processing grounding metadata: {e}")
             return answer, {}
 
-    def search(self, query: str):
-        client = genai_client.Client(
-            api_key=os.environ.get("GEMINI_KEY")
-        )
-
-        model_id = "gemini-2.0-flash"
-
-        google_search_tool = types.Tool(
-            google_search=types.GoogleSearch()
-        )
-
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "text/plain",
-            "response_modalities": ["TEXT"],
-            "tools": [google_search_tool]
-        }
-
-        response = client.models.generate_content(
-            model=model_id,
-            contents=query,
-            config=generation_config
-        )
-
-        response_dict = response.model_dump()
+    async def search(self, query: str):
+        profile = self.gateway.profiles["grounded_search"]
+        request_key = make_key(normalize_query(query), profile["model"], profile["config"])
+        cache_key = request_key if self.search_cache else None
+        if cache_key and self.memo_mode != "bypass":
+            cached = await self.search_cache.aget(cache_key)
+            if cached is not None:
+                formatted_text, sources = cached
+                # JSON turned the integer source indices into strings
+                return formatted_text, {int(i): source for i, source in sources.items()}
+        if self.memo_mode == "cache_only":
+            raise CacheMissError(f"No cached search result for: {query}")
+
+        async def fetch():
+            response = await self.gateway.generate_grounded(query)
+            formatted_text, sources = self.format_text_with_sources(response, response.text)
+            if cache_key:
+                await self.search_cache.aput(cache_key, [formatted_text, sources])
+            return formatted_text, sources
+
+        # Identical searches already in flight, from any branch or job, are awaited instead
+        return await self.single_flight.do(("search", request_key), fetch, self.metrics)
+
+    async def search_and_extract(self, query: str, num_learnings: int = 3, num_follow_up_questions: int = 3):
+        """
+        Fused pipeline: one grounded call returns the answer followed by a
+        JSON block of learnings and follow-up questions. Returns
+        (formatted_text, sources, extracted) like search() plus the
+        process_result payload; extracted is None when the JSON block is
+        missing or invalid, so the caller can fall back to process_result.
+        """
+        contents = f"""{query}
 
-        formatted_text, sources = self.format_text_with_sources(
-            response_dict, response.text)
+		Répondez de manière détaillée à la requête ci-dessus en vous appuyant sur la recherche Google.
+		Terminez ensuite votre réponse par un unique bloc ```json contenant un objet {{"learnings": [...], "follow_up_questions": [...]}} :
+		- learnings : au maximum {num_learnings} apprentissages uniques, concis et précis, riches en informations, incluant toutes les entités (personnes, lieux, entreprises, produits) ainsi que les mesures, chiffres et dates exacts
+		- follow_up_questions : au maximum {num_follow_up_questions} questions de suivi pour approfondir la recherche
+		"""
 
-        return formatted_text, sources
+        profile = self.gateway.profiles["grounded_search"]
+        request_key = make_key("fused", normalize_query(query), num_learnings, num_follow_up_questions,
+                               profile["model"], profile["config"])
+        cache_key = request_key if self.search_cache else None
+        if cache_key and self.memo_mode != "bypass":
+            cached = await self.search_cache.aget(cache_key)
+            if cached is not None:
+                formatted_text, sources, extracted = cached
+                return formatted_text, {int(i): source for i, source in sources.items()}, extracted
+        if self.memo_mode == "cache_only":
+            raise CacheMissError(f"No cached search result for: {query}")
+
+        async def fetch():
+            response = await self.gateway.generate_grounded(contents)
+            text = response.text or ""
+
+            # Citations are spliced over the whole text, then the JSON block is cut off
+            formatted_text, sources = self.format_text_with_sources(response, text)
+            extracted = None
+            fence = text.rfind("```json")
+            if fence != -1:
+                try:
+                    block = json.loads(text[fence + len("```json"):].split("```", 1)[0])
+                    extracted = {
+                        "learnings": [str(item) for item in block["learnings"]][:num_learnings],
+                        "follow_up_questions": [str(item) for item in block["follow_up_questions"]][:num_follow_up_questions]
+                    }
+                    formatted_text = formatted_text[:formatted_text.rfind("```json")].rstrip()
+                except (ValueError, KeyError, TypeError):
+                    extracted = None
+
+            if cache_key and extracted is not None:
+                await self.search_cache.aput(cache_key, [formatted_text, sources, extracted])
+            return formatted_text, sources, extracted
+
+        return await self.single_flight.do(("fused", request_key), fetch, self.metrics)
 
     async def process_result(
         self,
@@ -434,46 +630,8 @@ class DeepSearch:
     ):
         print(f"Processing result for query: {query}")
 
-        user_prompt = f"""
-		Étant donné le résultat suivant d'une recherche SERP pour la requête <query>{query}</query>, générez une liste d'apprentissages à partir du résultat. Renvoyez un maximum de {num_learnings} apprentissages, mais n'hésitez pas à en renvoyer moins si le résultat est clair. Assurez-vous que chaque apprentissage est unique et ne ressemble pas aux autres. Les apprentissages doivent être concis et précis, aussi détaillés et riches en informations que possible. Assurez-vous d'inclure toutes les entités telles que les personnes, les lieux, les entreprises, les produits, les objets, etc. dans les apprentissages, ainsi que toutes les mesures, chiffres ou dates exacts. Les apprentissages seront utilisés pour approfondir les recherches sur le sujet.
-		"""
-
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-            "response_schema": content.Schema(
-                type=content.Type.OBJECT,
-                enum=[],
-                required=["learnings", "follow_up_questions"],
-                properties={
-                    "learnings": content.Schema(
-                        type=content.Type.ARRAY,
-                        items=content.Schema(
-                            type=content.Type.STRING
-                        )
-                    ),
-                    "follow_up_questions": content.Schema(
-                        type=content.Type.ARRAY,
-                        items=content.Schema(
-                            type=content.Type.STRING
-                        )
-                    )
-                },
-            ),
-        }
-
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config=generation_config,
-        )
-
-        response = model.generate_content(user_prompt)
-        answer = response.text
-
-        answer_json = json.loads(answer)
+        user_prompt = self._learnings_prompt(query, result, num_learnings, num_follow_up_questions)
+        answer_json = await self._generate_structured("learnings", user_prompt)
 
         learnings = answer_json["learnings"]
         follow_up_questions = answer_json["follow_up_questions"]
@@ -484,7 +642,67 @@ class DeepSearch:
 
         return answer_json
 
-    def _are_queries_similar(self, query1: str, query2: str) -> bool:
+    def _learnings_prompt(self, query: str, result: str, num_learnings: int = 3,
+                          num_follow_up_questions: int = 3) -> str:
+        return f"""
+		Étant donné le résultat suivant d'une recherche SERP pour la requête <query>{query}</query>, générez une liste d'apprentissages à partir du résultat. Renvoyez un maximum de {num_learnings} apprentissages, mais n'hésitez pas à en renvoyer moins si le résultat est clair. Assurez-vous que chaque apprentissage est unique et ne ressemble pas aux autres. Les apprentissages doivent être concis et précis, aussi détaillés et riches en informations que possible. Assurez-vous d'inclure toutes les entités telles que les personnes, les lieux, les entreprises, les produits, les objets, etc. dans les apprentissages, ainsi que toutes les mesures, chiffres ou dates exacts. Les apprentissages seront utilisés pour approfondir les recherches sur le sujet. Proposez également au maximum {num_follow_up_questions} questions de suivi pour approfondir la recherche.
+
+		<result>{result}</result>
+		"""
+
+    async def process_results_batch(self, items: list[dict]) -> list:
+        """
+        Extract learnings for several search results in one structured call.
+        items are process_result keyword arguments; returns one result per
+        item, None for the items the answer leaves out. Each result is also
+        memoized as that item's own process_result answer, since which
+        siblings share a batch varies from run to run.
+        """
+        print(f"Processing {len(items)} results in one batch")
+
+        results = "\n".join(
+            f'<result index="{i}" query="{item["query"]}" max_learnings="{item["num_learnings"]}" '
+            f'max_follow_up_questions="{item["num_follow_up_questions"]}">{item["result"]}</result>'
+            for i, item in enumerate(items)
+        )
+        user_prompt = f"""
+		Voici les résultats de plusieurs recherches SERP, chacun avec son index, sa requête et ses limites. Pour chaque résultat, générez une liste d'apprentissages à partir de ce seul résultat, sans dépasser max_learnings, mais n'hésitez pas à en renvoyer moins si le résultat est clair. Assurez-vous que chaque apprentissage est unique et ne ressemble pas aux autres. Les apprentissages doivent être concis et précis, aussi détaillés et riches en informations que possible. Assurez-vous d'inclure toutes les entités telles que les personnes, les lieux, les entreprises, les produits, les objets, etc. dans les apprentissages, ainsi que toutes les mesures, chiffres ou dates exacts. Les apprentissages seront utilisés pour approfondir les recherches sur le sujet. Proposez également au maximum max_follow_up_questions questions de suivi par résultat pour approfondir la recherche.
+
+		Renvoyez un élément par résultat, avec son index.
+
+		{results}
+		"""
+
+        answer_json = await self._generate_structured("batch_learnings", user_prompt)
+
+        extracted = [None] * len(items)
+        for entry in answer_json["results"]:
+            index = entry.get("index")
+            if isinstance(index, int) and 0 <= index < len(items) and extracted[index] is None:
+                item = items[index]
+                extracted[index] = {
+                    "learnings": entry["learnings"][:item["num_learnings"]],
+                    "follow_up_questions": entry["follow_up_questions"][:item["num_follow_up_questions"]]
+                }
+                if self.stage_cache:
+                    await self.stage_cache.aput(
+                        self._memo_key("learnings", self._learnings_prompt(**item)), extracted[index])
+        return extracted
+
+    async def _extract(self, **item) -> dict:
+        """
+        process_result, through the sibling batcher when batching is on.
+        Items already memoized skip the batch; cache_only replays never
+        batch, every item being looked up on its own.
+        """
+        if self.extraction_batcher is None or self.memo_mode == "cache_only":
+            return await self.process_result(**item)
+        cached = await self._memoized("learnings", self._learnings_prompt(**item))
+        if cached is not None:
+            return cached
+        return await self.extraction_batcher.submit(item)
+
+    async def _are_queries_similar(self, query1: str, query2: str) -> bool:
         """Helper method to check if two queries are semantically similar using Gemini"""
         user_prompt = f"""
         Comparez ces deux requêtes de recherche et déterminez si elles sont sémantiquement similaires
@@ -502,133 +720,448 @@ class DeepSearch:
         Ne répondez que par vrai si les requêtes sont sensiblement similaires, sinon par faux.
         """
 
-        generation_config = {
-            "temperature": 0.1,  # Low temperature for more consistent results
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-            "response_schema": content.Schema(
-                type=content.Type.OBJECT,
-                required=["are_similar"],
-                properties={
-                    "are_similar": content.Schema(
-                        type=content.Type.BOOLEAN,
-                        description="True if queries are semantically similar, false otherwise"
-                    )
-                }
-            )
-        }
-
         try:
-            model = genai.GenerativeModel(
-                "gemini-2.0-flash",
-                generation_config=generation_config,
-            )
-
-            response = model.generate_content(user_prompt)
-            answer = json.loads(response.text)
+            answer = await self._generate_structured("query_similarity", user_prompt)
             return answer["are_similar"]
+        except CacheMissError:
+            raise
         except Exception as e:
             print(f"Error comparing queries: {str(e)}")
             # In case of error, assume queries are different to avoid missing potentially unique results
             return False
 
-    async def deep_research(self, query: str, breadth: int, depth: int, learnings: list[str] = [], visited_urls: dict[int, dict] = {}, parent_query: str = None):
-        progress = ResearchProgress(depth, breadth)
-        
-        # Start the root query
-        progress.start_query(query, depth, parent_query)
-
-        # Adjust number of queries based on mode
-        max_queries = {
-            "fast": 3,
-            "balanced": 7,
-            "comprehensive": 5 # kept lower than balanced due to recursive multiplication
-        }[self.mode]
-
-        queries = self.generate_queries(
-            query,
-            min(breadth, max_queries),
-            learnings,
-            previous_queries=self.query_history
-        )
+    async def _is_query_covered(self, query: str, ask_llm: bool = True) -> bool:
+        """
+        Check a candidate query against query_history using the local LSH
+        index; only borderline scores fall back to the LLM comparison, and
+        count as distinct when ask_llm is False.
+        """
+        match, score = self.query_index.most_similar(query)
+        if score >= DUPLICATE_THRESHOLD:
+            self.metrics.increment("duplicate_queries_skipped")
+            return True
+        if score < DISTINCT_THRESHOLD:
+            return False
+        if not ask_llm:
+            self.metrics.increment("query_similarity_budget_skips")
+            return False
 
-        self.query_history.update(queries)
-        unique_queries = list(queries)[:breadth]
+        self.metrics.increment("query_similarity_llm_checks")
+        if await self._are_queries_similar(query, match):
+            self.metrics.increment("duplicate_queries_skipped")
+            return True
+        return False
 
-        async def process_query(query_str: str, current_depth: int, parent: str = None):
-            try:
-                # Start this query as a sub-query of the parent
-                progress.start_query(query_str, current_depth, parent)
-
-                result = self.search(query_str)
-                processed_result = await self.process_result(
+    async def _research_node(self, progress: ResearchProgress, node: dict, breadth: int) -> dict:
+        """Search one frontier node and extract its learnings and follow-up questions"""
+        query_str, current_depth = node["query"], node["depth"]
+        try:
+            progress.start_query(query_str, current_depth, node["parent"])
+
+            result = await self._fetch_prefetched(query_str, breadth)
+            progress.add_sources(query_str, current_depth, result[1])
+            processed_result = result[2]
+            if self.pipeline == "fused":
+                self.metrics.increment("fused_nodes")
+            if processed_result is None:
+                if self.pipeline == "fused":
+                    self.metrics.increment("fused_fallbacks")
+                processed_result = await self._extract(
                     query=query_str,
                     result=result[0],
                     num_learnings=min(3, math.ceil(breadth / 2)),
                     num_follow_up_questions=min(2, math.ceil(breadth / 2))
                 )
 
-                # Record learnings
-                for learning in processed_result["learnings"]:
-                    progress.add_learning(query_str, current_depth, learning)
+            # Record learnings
+            for learning in processed_result["learnings"]:
+                progress.add_learning(query_str, current_depth, learning)
+
+            node_result = {
+                "query": query_str,
+                "depth": current_depth,
+                "parent": node["parent"],
+                "branch": node["branch"],
+                "learnings": processed_result["learnings"],
+                "follow_up_questions": processed_result["follow_up_questions"],
+                "visited_urls": result[1]
+            }
+            self._speculate(node_result, breadth)
+            return node_result
 
-                new_urls = result[1]
-                max_idx = max(visited_urls.keys()) if visited_urls else -1
-                all_urls = {
-                    **visited_urls,
-                    **{(i + max_idx + 1): url_data for i, url_data in new_urls.items()}
-                }
+        except CacheMissError:
+            # A cache_only replay must fail, not return partial results
+            raise
+        except Exception as e:
+            print(f"Error processing query {query_str}: {str(e)}")
+            self.metrics.increment("failed_nodes")
+            return {
+                "query": query_str,
+                "depth": current_depth,
+                "parent": node["parent"],
+                "branch": node["branch"],
+                "learnings": [],
+                "follow_up_questions": [],
+                "visited_urls": {},
+                "error": str(e)
+            }
 
-                # Only go deeper if in comprehensive mode and depth > 1
-                if self.mode == "comprehensive" and current_depth > 1:
-                    # Reduced breadth for deeper levels
-                    new_breadth = min(2, math.ceil(breadth / 2))
-                    new_depth = current_depth - 1
-
-                    # Select most important follow-up question instead of using all
-                    if processed_result['follow_up_questions']:
-                        # Take only the most relevant question
-                        next_query = processed_result['follow_up_questions'][0]
-                        
-                        # Process the sub-query
-                        sub_results = await process_query(
-                            next_query,
-                            new_depth,
-                            query_str  # Pass current query as parent
-                        )
-
-                progress.complete_query(query_str, current_depth)
-                return {
-                    "learnings": processed_result["learnings"],
-                    "visited_urls": all_urls
-                }
+    async def _fetch_node(self, query: str, breadth: int):
+        """Grounded retrieval for a node: (text, sources, extracted), extracted None in two_step"""
+        if self.pipeline == "fused":
+            return await self.search_and_extract(
+                query,
+                num_learnings=min(3, math.ceil(breadth / 2)),
+                num_follow_up_questions=min(2, math.ceil(breadth / 2))
+            )
+        formatted_text, sources = await self.search(query)
+        return formatted_text, sources, None
+
+    def _speculate(self, result: dict, breadth: int):
+        """Start searching the follow-ups of a finished node that the next level is likely to pick"""
+        if self._speculation_left <= 0 or result["depth"] <= 1:
+            return
+        budget = self.gateway.budget
+        candidates = 0
+        for question in result["follow_up_questions"]:
+            if candidates >= MODE_SETTINGS[self.mode]["follow_ups_per_node"] or self._speculation_left <= 0:
+                break
+            key = normalize_query(question)
+            if key in self._speculation or self.query_index.most_similar(question)[1] >= DUPLICATE_THRESHOLD:
+                continue
+            candidates += 1
+            if budget and budget.remaining_nodes(self.calls_per_node)[0] <= len(self._speculation):
+                break
+            self._speculation_left -= 1
+            self._speculation[key] = asyncio.create_task(self._prefetch(key, question, breadth))
+            self.metrics.increment("speculative_searches")
+
+    async def _prefetch(self, key: str, query: str, breadth: int):
+        """A speculative search, counted against max_concurrency like any node"""
+        async with self._node_slots or contextlib.nullcontext():
+            self._prefetching.add(key)
+            try:
+                return await self._fetch_node(query, breadth)
+            finally:
+                self._prefetching.discard(key)
+
+    async def _fetch_prefetched(self, query: str, breadth: int):
+        """Retrieval for a node, reusing its speculative prefetch when there is one"""
+        key = normalize_query(query)
+        task = self._speculation.pop(key, None)
+        if task is not None and not task.done() and key not in self._prefetching:
+            # Still queued for a slot while this node holds one: waiting for it could deadlock
+            task.cancel()
+            task = None
+        if task is not None:
+            try:
+                result = await task
+                self.metrics.increment("speculative_hits")
+                return result
+            except Exception:
+                self.metrics.increment("speculative_failures")
+        return await self._fetch_node(query, breadth)
+
+    def _settle_speculation(self, frontier: list[dict]):
+        """Drop the prefetches the next level did not pick, cancelling those still running"""
+        chosen = {normalize_query(node["query"]) for node in frontier}
+        for key in list(self._speculation):
+            if key in chosen:
+                continue
+            task = self._speculation.pop(key)
+            if not task.done():
+                task.cancel()
+                self.metrics.increment("speculative_cancelled")
+            elif not task.cancelled() and task.exception() is None:
+                # The call was paid for; its result stays in the search cache
+                self.metrics.increment("speculative_wasted")
+
+    async def _expand_frontier(self, progress: ResearchProgress, level_results: list[dict],
+                               limit: float = math.inf, budget: ResearchBudget = None) -> list[dict]:
+        """
+        Turn the follow-up questions of a finished level into the next
+        frontier, skipping questions already covered by query_history and
+        stopping at limit nodes. Nodes that spawn no children are completed
+        right away; the others complete once all their children have.
+
+        The LLM similarity checks are paid out of budget too: the frontier
+        shrinks to what is left after them, and a check is only made while
+        the budget still has room for it and the node it may admit.
+        """
+        follow_ups_per_node = MODE_SETTINGS[self.mode]["follow_ups_per_node"]
+        frontier = []
+        for result in level_results:
+            children = []
+            if result["depth"] > 1:
+                for question in result["follow_up_questions"]:
+                    taken = len(frontier) + len(children)
+                    if len(children) >= follow_ups_per_node or taken >= limit:
+                        break
+                    if budget is not None:
+                        # Similarity checks of this expansion may have spent what limit counted on
+                        allowed, reason = budget.remaining_nodes(self.calls_per_node)
+                        if taken >= allowed:
+                            budget.stopped_reason = budget.stopped_reason or reason
+                            break
+                    if await self._is_query_covered(question, self._can_check_similarity(budget, taken)):
+                        continue
+                    self.query_index.add(question)
+                    self.query_history.add(question)
+                    children.append({
+                        "query": question,
+                        "depth": result["depth"] - 1,
+                        "parent": result["query"],
+                        "branch": result["branch"]
+                    })
+
+            if not children:
+                progress.complete_query(result["query"], result["depth"])
+            frontier.extend(children)
+        return frontier
+
+    def _can_check_similarity(self, budget: ResearchBudget, taken: int) -> bool:
+        """Whether an LLM similarity check still leaves room for taken + 1 nodes"""
+        if budget is None:
+            return True
+        return budget.remaining_nodes(self.calls_per_node, reserved_calls=1)[0] > taken
+
+    def _budget_limit(self, budget: ResearchBudget, wanted: int) -> float:
+        """Number of new nodes the budget still allows, recording why it stopped"""
+        allowed, reason = budget.remaining_nodes(self.calls_per_node)
+        if wanted > allowed:
+            budget.stopped_reason = budget.stopped_reason or reason
+            self.metrics.increment("budget_skipped_nodes", wanted - allowed)
+        return allowed
+
+    def _restore_node(self, progress: ResearchProgress, result: dict):
+        """Replay a checkpointed node result into progress, without any API call"""
+        progress.start_query(result["query"], result["depth"], result["parent"])
+        progress.add_sources(result["query"], result["depth"], result["visited_urls"])
+        for learning in result["learnings"]:
+            progress.add_learning(result["query"], result["depth"], learning)
+
+    async def resume_research(self, run_id: str, budget: ResearchBudget = None):
+        """Resume a checkpointed run, researching only the sub-queries still pending"""
+        checkpoint = ResearchCheckpoint(run_id, self.checkpoint_dir)
+        if not checkpoint.exists():
+            raise FileNotFoundError(f"No checkpoint for run {run_id} in {checkpoint.directory}")
+        state = checkpoint.load()
+        return await self.deep_research(
+            state["query"], state["breadth"], state["depth"],
+            learnings=state["learnings"],
+            visited_urls=state["visited_urls"],
+            parent_query=state["parent_query"],
+            budget=budget,
+            run_id=run_id
+        )
 
-            except Exception as e:
-                print(f"Error processing query {query_str}: {str(e)}")
-                progress.complete_query(query_str, current_depth)
-                return {
-                    "learnings": [],
-                    "visited_urls": {}
-                }
+    async def deep_research(self, query: str, breadth: int, depth: int, learnings: list[str] = [], visited_urls: dict[int, dict] = {}, parent_query: str = None,
+                            budget: ResearchBudget = None, run_id: str = None):
+        """
+        Level-synchronous exploration of the research tree: every pending
+        sub-query of a depth level runs concurrently (bounded by
+        max_concurrency), then their follow-up questions form the next
+        level, until depth levels have been explored.
+
+        An optional ResearchBudget caps calls, tokens and wall-clock time:
+        no new node is scheduled once it would not fit, and whatever was
+        gathered up to that point is returned. The nodes of a level run in
+        one task group under the run's deadline: when it passes, or when
+        cancel() is called, the nodes still in flight are cancelled and the
+        results of the finished ones are kept.
+
+        Progress is journaled to journal_path (one JSON event per line) and
+        research_tree.json is kept current through debounced atomic
+        snapshots at tree_path.
+
+        The run is checkpointed as run_id (a new id when None): the pending
+        frontier at every level boundary and each node result as it
+        completes. Calling again with the id of an interrupted run (or
+        resume_research) replays the recorded results and researches only
+        what was still pending. The id is returned under "run_id".
+        """
+        checkpoint = ResearchCheckpoint(run_id or new_run_id(), self.checkpoint_dir)
+        recorders = []
+        if self.journal_path:
+            journal = TreeJournal(self.journal_path)
+            journal.open()
+            recorders.append(journal)
+        if self.tree_path:
+            recorders.append(TreeSnapshotWriter(self.tree_path))
+        for recorder in recorders:
+            self.events.subscribe(recorder)
 
-        # Process queries concurrently
-        tasks = [process_query(q, depth, query) for q in unique_queries]
-        results = await asyncio.gather(*tasks)
+        try:
+            return await self._explore(query, breadth, depth, learnings, visited_urls, parent_query, budget,
+                                       checkpoint)
+        finally:
+            self._settle_speculation([])
+            checkpoint.close()
+            await self.events.drain()
+            for recorder in recorders:
+                self.events.unsubscribe(recorder)
+                if isinstance(recorder, TreeSnapshotWriter):
+                    await recorder.flush()
+                else:
+                    recorder.close()
+
+    async def _explore(self, query: str, breadth: int, depth: int, learnings: list[str],
+                       visited_urls: dict[int, dict], parent_query: str, budget: ResearchBudget,
+                       checkpoint: ResearchCheckpoint):
+        budget = budget or ResearchBudget()
+        self.gateway.budget = budget
+        self._speculation_left = self.speculative_searches
+        self._cancel_requested = False
+        progress = ResearchProgress(depth, breadth, events=self.events)
 
-        # Combine results
-        all_learnings = list(set(
-            learning
-            for result in results
-            for learning in result["learnings"]
-        ))
+        # Start the root query
+        progress.start_query(query, depth, parent_query)
+
+        saved = checkpoint.load() if checkpoint.exists() else None
+        if saved and saved["frontier"] is not None:
+            print(f"Resuming run {checkpoint.run_id}")
+            self.metrics.increment("resumed_runs")
+            frontier = saved["frontier"]
+            pending = {(node["query"], node["depth"]) for node in frontier}
+            done = {}
+            results = []
+            for result in saved["results"]:
+                if (result["query"], result["depth"]) in pending:
+                    done[(result["query"], result["depth"])] = result
+                else:
+                    results.append(result)
+                    self._restore_node(progress, result)
+                self.query_index.add(result["query"])
+                self.query_history.add(result["query"])
+            for node in frontier:
+                self.query_index.add(node["query"])
+                self.query_history.add(node["query"])
+
+            # Nodes of earlier levels without children were already complete
+            parents = {result["parent"] for result in results} | {node["parent"] for node in frontier}
+            for result in results:
+                if result["query"] not in parents:
+                    progress.complete_query(result["query"], result["depth"])
+            checkpoint.resume()
+        else:
+            checkpoint.start({
+                "query": query,
+                "breadth": breadth,
+                "depth": depth,
+                "mode": self.mode,
+                "parent_query": parent_query,
+                "learnings": learnings,
+                "visited_urls": visited_urls
+            })
+
+            # Adjust number of queries based on mode
+            max_queries = MODE_SETTINGS[self.mode]["max_queries"]
+
+            queries = await self.generate_queries(
+                query,
+                min(breadth, max_queries),
+                learnings,
+                previous_queries=self.query_history
+            )
+
+            unique_queries = []
+            for candidate in queries:
+                if await self._is_query_covered(candidate, self._can_check_similarity(budget, len(unique_queries))):
+                    continue
+                unique_queries.append(candidate)
+                self.query_index.add(candidate)
+
+            self.query_history.update(unique_queries)
+            unique_queries = unique_queries[:breadth]
+            allowed = self._budget_limit(budget, len(unique_queries))
+            if allowed < len(unique_queries):
+                unique_queries = unique_queries[:allowed]
+
+            frontier = [{"query": q, "depth": depth, "parent": query, "branch": q} for q in unique_queries]
+            done = {}
+            results = []
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._node_slots = semaphore
+        finished = []  # results of the current level, in completion order
+
+        async def process_node(node: dict):
+            result = done.pop((node["query"], node["depth"]), None)
+            if result is not None:
+                self._restore_node(progress, result)
+            else:
+                async with semaphore:
+                    result = await self._research_node(progress, node, breadth)
+                if "error" not in result:
+                    checkpoint.record_result(result)
+            finished.append(result)
+            return result
+
+        loop = asyncio.get_running_loop()
+        deadline = None
+        if budget.deadline is not None:
+            deadline = loop.time() + budget.deadline - budget.elapsed()
+        interrupted = False
+        try:
+            async with asyncio.timeout_at(deadline) as self._scope:
+                if self._cancel_requested:
+                    self.cancel()
+                # Explore the tree one depth level at a time across all branches
+                while frontier:
+                    checkpoint.save_frontier(frontier)
+                    self.metrics.increment("frontier_levels")
+                    level_started = time.monotonic()
+                    # Leaving the group early (deadline, cancel) cancels every node still running
+                    async with asyncio.TaskGroup() as group:
+                        tasks = [group.create_task(process_node(node)) for node in frontier]
+                    level_results = [task.result() for task in tasks]
+                    budget.record_level(time.monotonic() - level_started)
+                    results.extend(level_results)
+                    # The level is kept already: an interruption from here on must not add it twice
+                    finished = []
+
+                    wanted = sum(
+                        min(len(result["follow_up_questions"]), MODE_SETTINGS[self.mode]["follow_ups_per_node"])
+                        for result in level_results if result["depth"] > 1
+                    )
+                    limit = self._budget_limit(budget, wanted) if wanted else 0
+                    frontier = await self._expand_frontier(progress, level_results, limit, budget)
+                    self._settle_speculation(frontier)
+        except TimeoutError:
+            if not self._scope.expired():
+                raise
+            interrupted = True
+            budget.stopped_reason = "cancelled" if self._cancel_requested else "deadline"
+            self.metrics.increment(f"research_{budget.stopped_reason}")
+            print(f"Research stopped ({budget.stopped_reason}), keeping {len(finished)} nodes of the current level")
+            # Nodes that finished before the interruption keep their learnings
+            results.extend(finished)
+            for result in finished:
+                progress.complete_query(result["query"], result["depth"])
+        finally:
+            self._scope = None
+            self._node_slots = None
+        self.gateway.budget = None
+
+        # Combine results, merging paraphrased learnings from parallel branches
+        learnings_found, learning_queries = [], []
+        for result in results:
+            for learning in result["learnings"]:
+                learnings_found.append(learning)
+                learning_queries.append(result["query"])
+        learning_clusters = cluster_learnings(learnings_found, learning_queries)
+        all_learnings = [cluster["learning"] for cluster in learning_clusters]
+        # Top-level sub-query each learning descends from, for report synthesis
+        branch_of = {result["query"]: result["branch"] for result in results}
+        learning_branches = [branch_of.get(cluster["queries"][0]) for cluster in learning_clusters]
+        self.metrics.increment("learnings_merged", len(learnings_found) - len(all_learnings))
 
         all_urls = {}
         current_idx = 0
         seen_urls = set()
-        for result in results:
-            for url_data in result["visited_urls"].values():
+        url_batches = [visited_urls] + [result["visited_urls"] for result in results]
+        for urls in url_batches:
+            for url_data in urls.values():
                 if url_data['link'] not in seen_urls:
                     all_urls[current_idx] = url_data
                     seen_urls.add(url_data['link'])
@@ -636,17 +1169,83 @@ class DeepSearch:
 
         # Complete the root query after all sub-queries are done
         progress.complete_query(query, depth)
-
-        # save the tree structure to a json file
-        with open("research_tree.json", "w") as f:
-            json.dump(progress._build_research_tree(), f)
+        if interrupted:
+            # The saved frontier still lists the unfinished nodes, so the run can be resumed
+            checkpoint.close()
+        else:
+            checkpoint.finish()
 
         return {
+            "run_id": checkpoint.run_id,
             "learnings": all_learnings,
-            "visited_urls": all_urls
+            "visited_urls": all_urls,
+            "learning_clusters": learning_clusters,
+            "learning_branches": learning_branches,
+            "budget": budget.report(),
+            "metrics": self.metrics.snapshot()
         }
 
-    def generate_final_report(self, query: str, learnings: list[str], visited_urls: dict[int, dict]) -> str:
+    async def _condense_group(self, query: str, items: list[str]) -> str:
+        """Condense a group of learnings (or digests) into one dense digest"""
+        items_text = "\n".join([f"- {item}" for item in items])
+        user_prompt = f"""
+		Vous préparez la synthèse d'une recherche sur la requête <query>{query}</query>. Condensez les apprentissages suivants en un seul résumé dense et factuel. Fusionnez les informations redondantes, mais conservez toutes les entités (personnes, lieux, entreprises, produits), ainsi que toutes les mesures, chiffres et dates exacts. N'ajoutez aucune information absente des apprentissages.
+
+		Apprentissages :
+		{items_text}
+		"""
+        try:
+            answer_json = await self._generate_structured("condense_learnings", user_prompt)
+            self.metrics.increment("report_condense_calls")
+            return answer_json["digest"]
+        except CacheMissError:
+            raise
+        except Exception as e:
+            print(f"Error condensing learnings: {str(e)}")
+            return " ".join(items)
+
+    async def _condense_learnings(self, query: str, learnings: list[str], branches: list[str] = None) -> list[str]:
+        """
+        Map-reduce the learnings down to at most report_condense_threshold
+        digests. Each round groups the items by research branch, splits the
+        groups into chunks of report_fan_in and condenses every chunk in
+        parallel; items left alone in their branch are pooled together. The
+        number of rounds grows with log(len(learnings)) / log(fan_in).
+        """
+        if not branches or len(branches) != len(learnings):
+            branches = [None] * len(learnings)
+        items = list(zip(branches, learnings))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def condense(branch: str, chunk: list[str]):
+            if len(chunk) == 1:
+                return branch, chunk[0]
+            async with semaphore:
+                return branch, await self._condense_group(query, chunk)
+
+        while len(items) > self.report_condense_threshold:
+            self.metrics.increment("report_condense_rounds")
+            by_branch = {}
+            for branch, item in items:
+                by_branch.setdefault(branch, []).append(item)
+
+            chunks, singles = [], []
+            for branch, group in by_branch.items():
+                for start in range(0, len(group), self.report_fan_in):
+                    chunk = group[start:start + self.report_fan_in]
+                    if len(chunk) == 1:
+                        singles.append(chunk[0])
+                    else:
+                        chunks.append((branch, chunk))
+            for start in range(0, len(singles), self.report_fan_in):
+                chunks.append((None, singles[start:start + self.report_fan_in]))
+
+            print(f"Condensing {len(items)} learnings into {len(chunks)} digests...")
+            items = await asyncio.gather(*(condense(branch, chunk) for branch, chunk in chunks))
+
+        return [item for _, item in items]
+
+    def _final_report_prompt(self, query: str, learnings: list[str], visited_urls: dict[int, dict]) -> str:
         # Format sources and learnings for the prompt
         sources_text = "\n".join([
             f"- {data['title']}: {data['link']}"
@@ -701,28 +1300,182 @@ class DeepSearch:
 
         Soyez audacieux et créatif dans votre approche tout en veillant à ce que le rapport communique efficacement toutes les informations importantes !
         """
+        return user_prompt
 
-        generation_config = {
-            "temperature": 0.9,  # Increased for more creativity
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        }
+    async def _generate_outline(self, query: str, learnings: list[str], sources: list[dict]) -> dict:
+        """
+        Plan the report: a title and ordered sections, each with the ids of
+        the learnings and sources it should draw on. Ids are validated and
+        made 0-based; learnings no section claimed go to the last section.
+        """
+        learnings_text = "\n".join([f"L{i + 1}. {learning}" for i, learning in enumerate(learnings)])
+        sources_text = "\n".join([f"S{i + 1}. {data['title']}: {data['link']}" for i, data in enumerate(sources)])
 
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config=generation_config,
-        )
+        user_prompt = f"""
+		Vous êtes un analyste de recherche chargé de planifier un rapport de recherche complet (environ {REPORT_WORDS} mots) sur la requête <query>{query}</query>.
+		Proposez un titre et un plan de 4 à 8 sections, introduction et conclusion comprises, avec des titres de section créatifs et une progression logique adaptée au sujet.
+		Pour chaque section, donnez un titre (heading), un court résumé de son contenu (brief), les numéros des apprentissages (learning_ids, sans le préfixe L) et des sources (source_ids, sans le préfixe S) qu'elle doit exploiter. Chaque apprentissage doit être utilisé par au moins une section.
+
+		Apprentissages :
+		{learnings_text}
+
+		Sources :
+		{sources_text}
+		"""
+        outline = await self._generate_structured("report_outline", user_prompt)
+
+        sections, claimed = [], set()
+        for section in outline.get("sections", []):
+            learning_ids = [i - 1 for i in dict.fromkeys(section.get("learning_ids", [])) if 1 <= i <= len(learnings)]
+            source_ids = [i - 1 for i in dict.fromkeys(section.get("source_ids", [])) if 1 <= i <= len(sources)]
+            claimed.update(learning_ids)
+            sections.append({
+                "heading": section["heading"],
+                "brief": section.get("brief", ""),
+                "learning_ids": learning_ids,
+                "source_ids": source_ids
+            })
+        if not sections:
+            raise ValueError("Empty report outline")
+        sections[-1]["learning_ids"] += [i for i in range(len(learnings)) if i not in claimed]
+
+        return {"title": outline.get("title") or query, "sections": sections}
+
+    async def _write_section(self, query: str, outline: dict, index: int, learnings: list[str],
+                             sources: list[dict]) -> str:
+        """Write one outline section from its own learnings, citing its sources as [1], [2], ..."""
+        section = outline["sections"][index]
+        plan_text = "\n".join([
+            f"{i + 1}. {other['heading']}" for i, other in enumerate(outline["sections"])
+        ])
+        learnings_text = "\n".join([f"- {learnings[i]}" for i in section["learning_ids"]])
+        sources_text = "\n".join([
+            f"[{n + 1}] {sources[i]['title']}: {sources[i]['link']}"
+            for n, i in enumerate(section["source_ids"])
+        ])
+        words = max(250, REPORT_WORDS // len(outline["sections"]))
+
+        user_prompt = f"""
+		Vous êtes un analyste de recherche créatif qui rédige une section d'un rapport intitulé « {outline['title']} » sur la requête <query>{query}</query>.
+
+		Plan complet du rapport :
+		{plan_text}
+
+		Rédigez uniquement la section {index + 1} : « {section['heading']} » ({section['brief']}).
+		Commencez par le titre Markdown « ## {section['heading']} », visez environ {words} mots et n'empiétez pas sur les autres sections du plan.
+		Rendez la section attrayante (récits, études de cas, analogies, scénarios) tout en conservant l'exactitude des faits, et incluez tous les points de données pertinents.
+		Citez les sources uniquement sous la forme [n], en utilisant exclusivement les numéros de la liste ci-dessous.
+
+		Apprentissages :
+		{learnings_text}
+
+		Sources :
+		{sources_text}
+		"""
+
+        started = time.monotonic()
+        try:
+            response = await self.gateway.generate("report_section", user_prompt)
+            text = response.text.strip()
+        except Exception as e:
+            print(f"Error writing section {section['heading']}: {str(e)}")
+            text = f"## {section['heading']}\n\n" + learnings_text
+        self.metrics.increment("report_sections")
+        self.metrics.add_time("report_section_seconds", time.monotonic() - started)
+        return text
+
+    async def _generate_sectioned_report(self, query: str, learnings: list[str], visited_urls: dict[int, dict],
+                                         on_chunk: Callable[[str], Any] = None) -> str:
+        """
+        Outline-first report: every section is written concurrently, then
+        the sections are stitched in outline order with their local
+        citations renumbered globally. Completed sections are handed to
+        on_chunk in order, as soon as every section before them is done.
+        """
+        sources = list(visited_urls.values())
+        outline = await self._generate_outline(query, learnings, sources)
+        print(f"Writing {len(outline['sections'])} report sections...")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def write(index: int):
+            async with semaphore:
+                return await self._write_section(query, outline, index, learnings, sources)
+
+        tasks = [asyncio.create_task(write(index)) for index in range(len(outline["sections"]))]
+        renumberer = CitationRenumberer()
+        parts = [f"# {outline['title']}\n\n"]
+        try:
+            if on_chunk:
+                on_chunk(parts[0])
+            for section, task in zip(outline["sections"], tasks):
+                text = renumberer.apply(await task, section["source_ids"]) + "\n\n"
+                parts.append(text)
+                if on_chunk:
+                    on_chunk(text)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        cited = renumberer.order
+        uncited = [i for i in range(len(sources)) if i not in renumberer.numbers]
+        parts.append("# Sources\n" + "\n".join(
+            [f"- [{n + 1}] [{sources[i]['title']}]({sources[i]['link']})" for n, i in enumerate(cited)] +
+            [f"- [{sources[i]['title']}]({sources[i]['link']})" for i in uncited]
+        ))
+        return "".join(parts)
+
+    async def generate_final_report(self, query: str, learnings: list[str], visited_urls: dict[int, dict],
+                                    on_chunk: Callable[[str], Any] = None, branches: list[str] = None) -> str:
+        """
+        Write the final Markdown report. With on_chunk, the report is
+        streamed and each text chunk is handed to on_chunk as it arrives;
+        citations and the Sources section are applied to the complete text
+        and included in the returned report either way.
+
+        Above report_condense_threshold learnings, they are first condensed
+        hierarchically (see _condense_learnings); branches gives the research
+        branch of each learning, as returned by deep_research. With the
+        "sections" strategy the report is written section by section (see
+        _generate_sectioned_report), falling back to a single generation if
+        no outline can be produced.
+        """
+        if len(learnings) > self.report_condense_threshold:
+            learnings = await self._condense_learnings(query, learnings, branches)
 
         print("Generating final report...\n")
 
-        response = model.generate_content(user_prompt)
+        forward = None
+        if on_chunk is not None:
+            started = time.monotonic()
+            first_chunk = []
+
+            def timed_chunk(text: str):
+                if not first_chunk:
+                    first_chunk.append(time.monotonic() - started)
+                    self.metrics.add_time("report_time_to_first_byte", first_chunk[0])
+                    logger.info(f"Final report time-to-first-byte: {first_chunk[0]:.2f}s")
+                on_chunk(text)
+
+            forward = timed_chunk
+
+        if self.report_strategy == "sections":
+            try:
+                return await self._generate_sectioned_report(query, learnings, visited_urls, forward)
+            except CacheMissError:
+                raise
+            except Exception as e:
+                print(f"Error generating sectioned report, falling back to a single pass: {str(e)}")
+
+        user_prompt = self._final_report_prompt(query, learnings, visited_urls)
+
+        if forward is None:
+            response = await self.gateway.generate("final_report", user_prompt)
+        else:
+            response = await self.gateway.generate_stream("final_report", user_prompt, forward)
 
         # Format the response with inline citations
-        formatted_text, sources = self.format_text_with_sources(
-            response.to_dict(),
-            response.text
-        )
+        formatted_text, sources = self.format_text_with_sources(response, response.text)
 
         # Add sources section
         sources_section = "\n# Sources\n" + "\n".join([
@@ -731,6 +1484,3 @@ class DeepSearch:
         ])
 
         return formatted_text + sources_section
-
-
-
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger("deep_research")
+
+# How long the first result of a batch waits for siblings, and the batch cap
+EXTRACTION_BATCH_WINDOW = 0.25
+EXTRACTION_BATCH_SIZE = 8
+
+
+class ExtractionBatcher:
+    """
+    Micro-batcher for learning extraction. Items submitted within window
+    seconds of the first one (or until max_batch are waiting) are handed to
+    extract_batch together; it returns one result per item, None where it
+    has nothing usable. Those items, and the whole batch if extract_batch
+    raises, fall back to extract_one. A batch of one goes straight to
+    extract_one. A batch whose waiters have all been cancelled (e.g. the
+    research level was interrupted) is cancelled too.
+    """
+
+    def __init__(self, extract_batch: Callable[[list], Awaitable[list]],
+                 extract_one: Callable[[Any], Awaitable[Any]],
+                 window: float = EXTRACTION_BATCH_WINDOW, max_batch: int = EXTRACTION_BATCH_SIZE,
+                 metrics=None):
+        self.extract_batch = extract_batch
+        self.extract_one = extract_one
+        self.window = window
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Waiters cancelled in the meantime are left out
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            futures = [future for _, future in batch]
+            for future in futures:
+                future.add_done_callback(lambda _: self._abandon(task, futures))
+
+    @staticmethod
+    def _abandon(task: asyncio.Task, futures: list):
+        """Cancel the batch's API calls once nobody is waiting for their result"""
+        if not task.done() and all(future.cancelled() for future in futures):
+            task.cancel()
+
+    async def _run(self, batch: list):
+        items = [item for item, _ in batch]
+        results = [None] * len(items)
+        if len(items) > 1:
+            self._count("extraction_batches")
+            self._count("extraction_batched_items", len(items))
+            try:
+                results = list(await self.extract_batch(items))
+                if len(results) != len(items):
+                    raise ValueError(f"expected {len(items)} results, got {len(results)}")
+            except Exception as e:
+                logger.warning(f"Batched extraction failed, falling back to single calls: {e}")
+                results = [None] * len(items)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(items) > 1 and missing:
+            self._count("extraction_batch_fallbacks", len(missing))
+        singles = await asyncio.gather(*(self.extract_one(items[i]) for i in missing),
+                                       return_exceptions=True)
+        for i, result in zip(missing, singles):
+            results[i] = result
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, asyncio.CancelledError):
+                future.cancel()
+            elif isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _count(self, name: str, amount: int = 1):
+        if self.metrics:
+            self.metrics.increment(name, amount)
+
+    async def aclose(self):
+        """Drop items still waiting for their window and cancel running batches"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,332 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Iterable
+
+import google.generativeai as genai
+from google.generativeai.client import _ClientManager
+
+from google import genai as genai_client
+from google.genai import types
+
+from .generation_profiles import GENERATION_PROFILES
+from .hedging import HedgePolicy
+from .key_pool import KeyPool
+from .rate_limiter import DEFAULT_KEY, RateLimiter, estimate_tokens
+from .retry import RetryEngine
+
+# Seconds a single Gemini request may take once sent, per generation profile
+# ("default" for the others); streamed profiles cover the whole stream
+CALL_TIMEOUTS = {
+    "default": 90.0,
+    "grounded_search": 120.0,
+    "report_section": 300.0,
+    "final_report": 600.0,
+}
+
+
+async def run_in_thread(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking SDK call in a worker thread so the event loop keeps running"""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def iterate_in_thread(iterable: Iterable) -> AsyncIterator:
+    """Consume a blocking iterator (e.g. a sync stream) from a worker thread"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def pump():
+        try:
+            for item in iterable:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    worker = asyncio.create_task(asyncio.to_thread(pump))
+    while True:
+        item = await queue.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    await worker
+
+
+class GeminiGateway:
+    """
+    Single async entry point for every Gemini request issued by DeepSearch.
+    Uses the native async variants of both SDKs and falls back to a thread
+    offload for any call that has no async counterpart. Every request goes
+    through the shared RateLimiter.
+
+    The gateway owns one google.genai client per API key (whose HTTP
+    connection pool is kept alive between calls) and one GenerativeModel
+    per generation profile and key, so sub-queries reuse connections
+    instead of re-handshaking. With a KeyPool of several keys, the rate
+    limiter picks the key of every request.
+
+    Token usage of every response is added to the metrics and, while a
+    research run is in progress, to its ResearchBudget.
+
+    hedge_policies maps a profile name to a HedgePolicy: calls of that
+    profile still unanswered at the policy's latency percentile are sent a
+    second time, when the rate limiter has a slot free right away and the
+    call budget is not exhausted; the first answer wins and the other
+    request is cancelled. Send-to-answer latencies are recorded per profile
+    as latency_<profile>.
+
+    Every request is bounded by its profile's timeout (CALL_TIMEOUTS,
+    overridable through timeouts) and raises TimeoutError past it, so a hung
+    connection cannot stall the caller. Failures go through the RetryEngine:
+    transient ones are retried with backoff behind a circuit breaker per
+    model and endpoint, deterministic ones are briefly cached.
+    """
+
+    def __init__(self, api_key: str, rate_limiter: RateLimiter = None, profiles: dict = None,
+                 metrics=None, hedge_policies: dict[str, HedgePolicy] = None,
+                 timeouts: dict[str, float] = None, retry: RetryEngine = None,
+                 key_pool: KeyPool = None):
+        self.key_pool = key_pool or KeyPool([api_key])
+        self.api_key = next(iter(self.key_pool.keys.values()))
+        self.rate_limiter = rate_limiter or RateLimiter(keys=self.key_pool.labels)
+        self.metrics = metrics
+        self.budget = None
+        self.profiles = profiles or GENERATION_PROFILES
+        self.hedge_policies = hedge_policies or {}
+        self.timeouts = {**CALL_TIMEOUTS, **(timeouts or {})}
+        self.retry = retry or RetryEngine(metrics=metrics)
+        genai.configure(api_key=self.api_key)
+        self.clients = {label: genai_client.Client(api_key=key) for label, key in self.key_pool.items()}
+        self._models = {}
+        self._configs = {}
+        self._client_managers = {}
+
+    @property
+    def client(self):
+        """google.genai client of the first key"""
+        return self.clients[self.key_pool.labels[0]]
+
+    def model_for(self, profile_name: str, key: str = DEFAULT_KEY) -> genai.GenerativeModel:
+        if (profile_name, key) not in self._models:
+            profile = self.profiles[profile_name]
+            model = genai.GenerativeModel(
+                profile["model"],
+                generation_config=profile["config"],
+            )
+            if len(self.key_pool) > 1:
+                # google.generativeai only takes a process-wide key: give the
+                # model the clients of its own key instead
+                if key not in self._client_managers:
+                    manager = _ClientManager()
+                    manager.configure(api_key=self.key_pool.keys[key])
+                    self._client_managers[key] = manager
+                model._client = self._client_managers[key].make_client("generative")
+                model._async_client = self._client_managers[key].make_client("generative_async")
+            self._models[profile_name, key] = model
+        return self._models[profile_name, key]
+
+    def config_for(self, profile_name: str) -> types.GenerateContentConfig:
+        """Validated google.genai config, built once per profile"""
+        if profile_name not in self._configs:
+            self._configs[profile_name] = types.GenerateContentConfig(
+                **self.profiles[profile_name]["config"])
+        return self._configs[profile_name]
+
+    def timeout_for(self, profile_name: str) -> float:
+        return self.timeouts.get(profile_name, self.timeouts["default"])
+
+    def _with_timeout(self, profile_name: str, send):
+        """send(*args) bounded by the profile's timeout"""
+        timeout = self.timeout_for(profile_name)
+
+        async def bounded_send(*args):
+            try:
+                async with asyncio.timeout(timeout):
+                    return await send(*args)
+            except TimeoutError:
+                if self.metrics:
+                    self.metrics.increment(f"timeouts_{profile_name}")
+                raise
+
+        return bounded_send
+
+    async def _call(self, profile_name: str, prompt: str, send, endpoint: str = "generate_content"):
+        """One logical request: retried, hedged, rate limited and bounded by its timeout"""
+        model_name = self.profiles[profile_name]["model"]
+        return await self.retry.call(f"{model_name}/{endpoint}", (profile_name, prompt),
+                                     lambda: self._attempt(profile_name, model_name, prompt, send))
+
+    async def _attempt(self, profile_name: str, model_name: str, prompt: str, send):
+        send = self._with_timeout(profile_name, send)
+        sent_at = []
+
+        async def timed_send(key: str):
+            sent_at.append(time.monotonic())
+            return await send(key)
+
+        policy = self.hedge_policies.get(profile_name)
+        if policy is None:
+            response = await self.rate_limiter.call(model_name, prompt, timed_send)
+        else:
+            response, primary_latency = await self._hedged(profile_name, model_name, prompt, send,
+                                                           timed_send, sent_at, policy)
+            policy.observe(primary_latency)
+        latency = time.monotonic() - sent_at[0]
+        if self.metrics:
+            self.metrics.record_latency(f"latency_{profile_name}", latency)
+        self._account(response)
+        return response
+
+    def _may_hedge(self, model_name: str, prompt: str) -> str:
+        """Key of a slot booked for a hedge, None when hedging is not allowed right now"""
+        if self.budget and self.budget.max_calls is not None and self.budget.calls >= self.budget.max_calls:
+            return None
+        return self.rate_limiter.try_acquire(model_name, estimate_tokens(prompt))
+
+    async def _hedged(self, profile_name: str, model_name: str, prompt: str, send, timed_send,
+                      sent_at: list, policy: HedgePolicy):
+        """
+        First answer of the call and, past the policy's delay, a duplicate of
+        it. Also returns the primary request's own latency for the policy:
+        its send-to-answer time, or the time it had been waiting when the
+        hedge was sent if the hedge answered first, so hedged answers do not
+        drag the percentile down.
+        """
+        delay = policy.delay()
+        primary = asyncio.ensure_future(self.rate_limiter.call(model_name, prompt, timed_send))
+        pending = {primary}
+        hedge = None
+        hedged_after = None
+        error = None
+        try:
+            while pending:
+                timeout = None
+                if hedge is None and delay is not None:
+                    # The delay runs from when the request left the rate limiter
+                    timeout = max(0.0, sent_at[-1] + delay - time.monotonic()) if sent_at else delay
+                done, pending = await asyncio.wait(pending, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if sent_at and time.monotonic() - sent_at[-1] >= delay:
+                        hedge = False
+                        key = self._may_hedge(model_name, prompt)
+                        if key is not None:
+                            hedge = asyncio.ensure_future(
+                                self.rate_limiter.call(model_name, prompt, send, acquired=key))
+                            pending.add(hedge)
+                            hedged_after = time.monotonic() - sent_at[-1]
+                            self._account_hedge(profile_name)
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            if self.metrics:
+                                self.metrics.increment(f"hedge_wins_{profile_name}")
+                            return task.result(), hedged_after
+                        return task.result(), time.monotonic() - sent_at[-1]
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _account_hedge(self, profile_name: str):
+        """
+        A hedge is one more request against the quotas: only one of the two
+        answers is accounted by _account, so the extra call is counted when
+        it is sent (its tokens are not known, the loser being cancelled)
+        """
+        if self.metrics:
+            self.metrics.increment(f"hedged_{profile_name}")
+            self.metrics.increment("api_calls")
+        if self.budget:
+            self.budget.record()
+
+    def _account(self, response):
+        if self.metrics:
+            usage = getattr(response, "usage_metadata", None)
+            self.metrics.increment("api_calls")
+            if usage is not None:
+                self.metrics.increment("input_tokens", getattr(usage, "prompt_token_count", None) or 0)
+                self.metrics.increment("output_tokens", getattr(usage, "candidates_token_count", None) or 0)
+        if self.budget:
+            self.budget.record(response)
+
+    async def generate(self, profile_name: str, prompt: str):
+        """Structured / free-form generation through google.generativeai"""
+        async def send(key: str):
+            model = self.model_for(profile_name, key)
+            generate_async = getattr(model, "generate_content_async", None)
+            if generate_async is not None:
+                return await generate_async(prompt)
+            return await run_in_thread(model.generate_content, prompt)
+
+        return await self._call(profile_name, prompt, send)
+
+    async def generate_stream(self, profile_name: str, prompt: str, on_chunk: Callable[[str], Any]):
+        """
+        Free-form generation streamed to on_chunk as text arrives. Returns
+        the aggregated response once the stream is exhausted; usage is
+        accounted at that point, when the totals are known.
+        """
+        async def send(key: str):
+            model = self.model_for(profile_name, key)
+            generate_async = getattr(model, "generate_content_async", None)
+            if generate_async is not None:
+                return await generate_async(prompt, stream=True)
+            return await run_in_thread(model.generate_content, prompt, stream=True)
+
+        model_name = self.profiles[profile_name]["model"]
+        # Only opening the stream is retried: once text has been handed to on_chunk it cannot be taken back
+        response = await self.retry.call(
+            f"{model_name}/stream_generate_content", (profile_name, prompt),
+            lambda: self.rate_limiter.call(model_name, prompt, self._with_timeout(profile_name, send))
+        )
+
+        async def consume():
+            chunks = response if hasattr(response, "__aiter__") else iterate_in_thread(response)
+            async for chunk in chunks:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks carrying only a finish reason or safety ratings
+                    continue
+                if text:
+                    on_chunk(text)
+
+        # Reading the stream gets its own timeout, once it has been opened
+        await self._with_timeout(profile_name, consume)()
+        self._account(response)
+        return response
+
+    async def generate_grounded(self, contents: str, profile_name: str = "grounded_search"):
+        """Grounded generation (Google Search tool) through google.genai"""
+        model_id = self.profiles[profile_name]["model"]
+        config = self.config_for(profile_name)
+
+        async def send(key: str):
+            client = self.clients[key]
+            aio = getattr(client, "aio", None)
+            if aio is not None:
+                return await aio.models.generate_content(
+                    model=model_id,
+                    contents=contents,
+                    config=config
+                )
+            return await run_in_thread(
+                client.models.generate_content,
+                model=model_id,
+                contents=contents,
+                config=config
+            )
+
+        return await self._call(profile_name, contents, send, endpoint="grounded_search")
+
+    async def aclose(self):
+        """Release the pooled HTTP connections"""
+        for client in self.clients.values():
+            aio = getattr(client, "aio", None)
+            if aio is not None and hasattr(aio, "aclose"):
+                await aio.aclose()
@@ -0,0 +1,230 @@
+from google.genai import types
+
+from google.ai.generativelanguage_v1beta.types import content
+
+
+# Generation configs shared by every DeepSearch call of a given type. They are
+# built once at import time instead of re-creating the response schemas on
+# each request; GeminiGateway caches one model object per profile.
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+
+def _string_array() -> content.Schema:
+    return content.Schema(
+        type=content.Type.ARRAY,
+        items=content.Schema(
+            type=content.Type.STRING,
+        ),
+    )
+
+
+GENERATION_PROFILES = {
+    "research_plan": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                enum=[],
+                required=["breadth", "depth", "explanation"],
+                properties={
+                    "breadth": content.Schema(type=content.Type.NUMBER),
+                    "depth": content.Schema(type=content.Type.NUMBER),
+                    "explanation": content.Schema(type=content.Type.STRING),
+                },
+            ),
+        },
+    },
+    "follow_up_questions": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                enum=[],
+                required=["follow_up_queries"],
+                properties={
+                    "follow_up_queries": _string_array(),
+                },
+            ),
+        },
+    },
+    "serp_queries": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                enum=[],
+                required=["queries"],
+                properties={
+                    "queries": _string_array(),
+                },
+            ),
+            "response_mime_type": "application/json",
+        },
+    },
+    "learnings": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                enum=[],
+                required=["learnings", "follow_up_questions"],
+                properties={
+                    "learnings": _string_array(),
+                    "follow_up_questions": _string_array(),
+                },
+            ),
+        },
+    },
+    "batch_learnings": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                enum=[],
+                required=["results"],
+                properties={
+                    "results": content.Schema(
+                        type=content.Type.ARRAY,
+                        items=content.Schema(
+                            type=content.Type.OBJECT,
+                            required=["index", "learnings", "follow_up_questions"],
+                            properties={
+                                "index": content.Schema(type=content.Type.INTEGER),
+                                "learnings": _string_array(),
+                                "follow_up_questions": _string_array(),
+                            },
+                        ),
+                    ),
+                },
+            ),
+        },
+    },
+    "query_similarity": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 0.1,  # Low temperature for more consistent results
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                required=["are_similar"],
+                properties={
+                    "are_similar": content.Schema(
+                        type=content.Type.BOOLEAN,
+                        description="True if queries are semantically similar, false otherwise"
+                    )
+                }
+            ),
+        },
+    },
+    "condense_learnings": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 0.3,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                required=["digest"],
+                properties={
+                    "digest": content.Schema(type=content.Type.STRING),
+                },
+            ),
+        },
+    },
+    "final_report": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 0.9,  # Increased for more creativity
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+        },
+    },
+    "report_outline": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": content.Schema(
+                type=content.Type.OBJECT,
+                required=["title", "sections"],
+                properties={
+                    "title": content.Schema(type=content.Type.STRING),
+                    "sections": content.Schema(
+                        type=content.Type.ARRAY,
+                        items=content.Schema(
+                            type=content.Type.OBJECT,
+                            required=["heading", "brief", "learning_ids", "source_ids"],
+                            properties={
+                                "heading": content.Schema(type=content.Type.STRING),
+                                "brief": content.Schema(type=content.Type.STRING),
+                                "learning_ids": content.Schema(
+                                    type=content.Type.ARRAY,
+                                    items=content.Schema(type=content.Type.INTEGER),
+                                ),
+                                "source_ids": content.Schema(
+                                    type=content.Type.ARRAY,
+                                    items=content.Schema(type=content.Type.INTEGER),
+                                ),
+                            },
+                        ),
+                    ),
+                },
+            ),
+        },
+    },
+    "report_section": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 0.9,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+        },
+    },
+    "grounded_search": {
+        "model": DEFAULT_MODEL,
+        "config": {
+            "temperature": 1,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "text/plain",
+            "response_modalities": ["TEXT"],
+            "tools": [types.Tool(google_search=types.GoogleSearch())],
+        },
+    },
+}
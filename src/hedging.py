@@ -0,0 +1,35 @@
+from collections import deque
+
+from .metrics import percentile
+
+
+# Latency samples kept per call type, and how many are needed before hedging
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 10
+
+
+class HedgePolicy:
+    """
+    Hedging for one call type: once a call has been waiting longer than
+    the given percentile of the recent latencies of that type, a duplicate
+    is sent and the first answer wins. No hedge is sent before min_samples
+    latencies have been observed, nor sooner than min_delay seconds.
+    """
+
+    def __init__(self, percentile: float = 95, min_samples: int = HEDGE_MIN_SAMPLES,
+                 min_delay: float = 0.5, window: int = HEDGE_WINDOW):
+        if not 0 < percentile < 100:
+            raise ValueError("hedge percentile must be between 0 and 100")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def delay(self) -> float:
+        """Seconds to wait before hedging, None while there are too few samples"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, percentile(self.latencies, self.percentile))
@@ -0,0 +1,44 @@
+import os
+from pathlib import Path
+
+
+def load_api_keys(path: str = None) -> list[str]:
+    """
+    Gemini API keys from a file (one key per line, # starts a comment) when
+    path or GEMINI_KEYS_FILE is set, else from GEMINI_KEYS (comma-separated),
+    else the single GEMINI_KEY.
+    """
+    path = path or os.environ.get("GEMINI_KEYS_FILE")
+    if path:
+        lines = Path(path).read_text(encoding="utf-8").splitlines()
+        keys = [line.split("#", 1)[0].strip() for line in lines]
+    elif os.environ.get("GEMINI_KEYS"):
+        keys = [key.strip() for key in os.environ["GEMINI_KEYS"].split(",")]
+    else:
+        keys = [os.environ.get("GEMINI_KEY", "")]
+    return [key for key in keys if key]
+
+
+class KeyPool:
+    """
+    The API keys a DeepSearch instance spreads its requests over. Keys are
+    referred to by label (key1, key2, ...) everywhere else, so rate limits,
+    cool-downs and usage can be tracked per key without the secrets
+    showing up in metrics or logs.
+    """
+
+    def __init__(self, api_keys: list[str]):
+        unique = list(dict.fromkeys(key for key in api_keys if key))
+        if not unique:
+            raise ValueError("At least one Gemini API key is required")
+        self.keys = {f"key{i + 1}": key for i, key in enumerate(unique)}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def labels(self) -> list[str]:
+        return list(self.keys)
+
+    def items(self):
+        return self.keys.items()
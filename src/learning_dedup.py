@@ -0,0 +1,110 @@
+import re
+import zlib
+
+import numpy as np
+
+from .query_index import normalize_text
+
+
+# Words that flip or orient the meaning of a fact (English and French, accent-stripped):
+# two learnings differing on one of these are not duplicates, however similar
+POLARITY_WORDS = {
+    "not", "no", "never", "without", "none", "nor",
+    "increase", "increased", "increases", "increasing", "grew", "grow", "grows", "rise", "rose",
+    "risen", "rises", "up", "higher", "more", "gain", "gained", "above",
+    "decrease", "decreased", "decreases", "decreasing", "shrank", "shrink", "shrinks", "shrunk",
+    "fell", "fall", "falls", "drop", "dropped", "drops", "decline", "declined", "down", "lower",
+    "less", "loss", "lost", "below",
+    "ne", "pas", "jamais", "sans", "aucun", "aucune", "ni",
+    "hausse", "augmente", "augmentation", "progresse", "progression", "croissance", "plus",
+    "baisse", "diminue", "diminution", "recule", "recul", "chute", "moins",
+}
+
+
+def fact_signature(text: str) -> frozenset:
+    """Numbers, dates, polarity words and acronyms of a learning, which must match for it to be merged"""
+    words = normalize_text(text).split()
+    signature = {word for word in words if re.search(r"\d", word) or word in POLARITY_WORDS}
+    signature.update(re.findall(r"\b[A-Z]{2,}\b", text))
+    return frozenset(signature)
+
+
+def hashed_tfidf(texts: list[str], n_features: int = 1024) -> np.ndarray:
+    """
+    L2-normalized TF-IDF matrix over hashed word unigrams and bigrams.
+    Hashing keeps the vocabulary fixed so no fitting pass is needed.
+    """
+    cells = []
+    for row, text in enumerate(texts):
+        words = normalize_text(text).split()
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        offset = row * n_features
+        cells.extend(offset + zlib.crc32(term.encode("utf-8")) % n_features for term in terms)
+
+    # Work on the non-zero cells only, then scatter into a dense matrix
+    cells, counts = np.unique(np.array(cells, dtype=np.int64), return_counts=True)
+    rows, cols = np.divmod(cells, n_features)
+
+    # Sublinear term frequency and smoothed inverse document frequency
+    df = np.bincount(cols, minlength=n_features)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+    values = (np.log1p(counts) * idf[cols]).astype(np.float32)
+
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+    norms[norms == 0] = 1.0
+    values /= norms[rows].astype(np.float32)
+
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    matrix[rows, cols] = values
+    return matrix
+
+
+def cluster_learnings(learnings: list[str], queries: list[str] = None,
+                      threshold: float = 0.9, block_size: int = 1024) -> list[dict]:
+    """
+    Group near-duplicate learnings and keep the first-seen one of each group.
+
+    Cosine similarities are computed block by block against the whole set;
+    each learning joins the earliest preceding representative it matches
+    with the same fact_signature (so "grew 12%" and "shrank 12%", or "by
+    2025" and "by 2030", stay apart), otherwise it starts a new cluster. Returns clusters in first-seen order:
+    {"learning": representative, "members": [...], "queries": [...]}, where
+    queries lists the research queries the members came from.
+    """
+    if queries is None:
+        queries = [None] * len(learnings)
+
+    texts, origins = [], []
+    for learning, query in zip(learnings, queries):
+        if learning and learning.strip():
+            texts.append(learning)
+            origins.append(query)
+    if not texts:
+        return []
+
+    vectors = hashed_tfidf(texts)
+    signatures = [fact_signature(text) for text in texts]
+    n = len(texts)
+    representative = np.full(n, -1, dtype=np.int64)
+    is_representative = np.zeros(n, dtype=bool)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        similarities = vectors[start:stop] @ vectors[:stop].T
+        for offset, row in enumerate(similarities):
+            i = start + offset
+            matches = np.flatnonzero((row[:i] >= threshold) & is_representative[:i])
+            match = next((j for j in matches if signatures[j] == signatures[i]), None)
+            if match is not None:
+                representative[i] = match
+            else:
+                representative[i] = i
+                is_representative[i] = True
+
+    clusters = {}
+    for i, rep in enumerate(representative):
+        cluster = clusters.setdefault(int(rep), {"learning": texts[rep], "members": [], "queries": []})
+        cluster["members"].append(texts[i])
+        if origins[i] is not None and origins[i] not in cluster["queries"]:
+            cluster["queries"].append(origins[i])
+    return list(clusters.values())
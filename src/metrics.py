@@ -0,0 +1,44 @@
+import math
+from collections import defaultdict
+
+
+def percentile(samples, p: float) -> float:
+    """Nearest-rank percentile of samples (p in 0-100), 0.0 when empty"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RunMetrics:
+    """Counters, accumulated timings and latency samples collected while a DeepSearch instance runs"""
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)
+        self.latencies = defaultdict(list)
+
+    def increment(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def add_time(self, name: str, seconds: float):
+        self.timings[name] += seconds
+
+    def record_latency(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+
+    def latency_summary(self, name: str) -> dict:
+        samples = self.latencies.get(name, [])
+        return {
+            "count": len(samples),
+            **{f"p{p}": round(percentile(samples, p), 3) for p in (50, 95, 99)}
+        }
+
+    def snapshot(self) -> dict:
+        """Plain-dict copy suitable for json.dump"""
+        return {
+            "counters": dict(self.counters),
+            "timings": {name: round(value, 3) for name, value in self.timings.items()},
+            "latencies": {name: self.latency_summary(name) for name in self.latencies}
+        }
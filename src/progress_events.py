@@ -0,0 +1,168 @@
+import asyncio
+import inspect
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger("deep_research")
+
+QUERY_STARTED = "query_started"
+LEARNING_ADDED = "learning_added"
+QUERY_COMPLETED = "query_completed"
+SOURCES_ADDED = "sources_added"
+EVENT_TYPES = (QUERY_STARTED, LEARNING_ADDED, QUERY_COMPLETED, SOURCES_ADDED)
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """
+    One change to the research tree. learning is set for learning_added,
+    sources (index -> {"link", "title"}) for sources_added; completed and
+    total are the query counters right after the change.
+    """
+    type: str
+    node_id: str
+    query: str
+    depth: int
+    parent_id: str = None
+    parent_query: str = None
+    learning: str = None
+    sources: dict = None
+    completed: int = 0
+    total: int = 0
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ProgressBus:
+    """
+    Fan-out of ProgressEvents to subscribers. publish() only enqueues the
+    event; a dispatcher task on the running loop hands it to every
+    subscriber in order, awaiting coroutine subscribers, so a slow UI or
+    logger never runs inside the research code path. Outside an event loop
+    events are delivered synchronously. A failing subscriber is logged and
+    does not affect the others.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def subscribe(self, callback: Callable[[ProgressEvent], Any]) -> Callable[[ProgressEvent], Any]:
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable[[ProgressEvent], Any]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def publish(self, event: ProgressEvent):
+        if not self._subscribers:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            for callback in list(self._subscribers):
+                self._deliver_sync(callback, event)
+            return
+        if self._loop is not loop:
+            self._start(loop)
+        self._queue.put_nowait(event)
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._dispatch(self._queue))
+
+    async def _dispatch(self, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            for callback in list(self._subscribers):
+                try:
+                    result = callback(event)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Progress subscriber failed on {event.type}: {e}")
+            queue.task_done()
+
+    def _deliver_sync(self, callback: Callable, event: ProgressEvent):
+        try:
+            result = callback(event)
+            if inspect.iscoroutine(result):
+                result.close()
+                logger.warning(f"Async progress subscriber skipped outside an event loop: {callback!r}")
+        except Exception as e:
+            logger.error(f"Progress subscriber failed on {event.type}: {e}")
+
+    async def drain(self):
+        """Wait until every published event has reached the subscribers"""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def aclose(self):
+        await self.drain()
+        if self._task is not None:
+            self._task.cancel()
+            if self._loop is asyncio.get_running_loop():
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._queue = self._loop = None
+
+
+class ProgressTree:
+    """
+    Research tree rebuilt from ProgressEvents alone, in the format of
+    ResearchProgress._build_research_tree. Usable as a subscriber, to
+    mirror a run live, or to replay a journal.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.nodes = {}  # id -> tree node
+
+    def __call__(self, event: ProgressEvent):
+        self.apply(event)
+
+    def apply(self, event: ProgressEvent):
+        node = self.nodes.get(event.node_id)
+        if event.type == QUERY_STARTED and node is None:
+            node = {
+                "query": event.query,
+                "id": event.node_id,
+                "status": "in_progress",
+                "depth": event.depth,
+                "learnings": [],
+                "sub_queries": [],
+                "parent_query": event.parent_query
+            }
+            self.nodes[event.node_id] = node
+            parent = self.nodes.get(event.parent_id)
+            if parent is not None:
+                parent["sub_queries"].append(node)
+            elif event.parent_id is None:
+                self.root = node
+        elif node is None:
+            return
+        elif event.type == LEARNING_ADDED:
+            node["learnings"].append(event.learning)
+        elif event.type == QUERY_COMPLETED:
+            node["status"] = "completed"
+
+
+def print_event(event: ProgressEvent):
+    """Console subscriber: one line per event"""
+    actions = {
+        QUERY_STARTED: "Starting query",
+        LEARNING_ADDED: "Added learning for query",
+        QUERY_COMPLETED: "Completed query",
+        SOURCES_ADDED: f"Added {len(event.sources or {})} sources for query",
+    }
+    print(f"[{event.completed}/{event.total}] {actions.get(event.type, event.type)}: {event.query}")
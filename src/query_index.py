@@ -0,0 +1,130 @@
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+
+# Universal hashing (a * h + b) mod p; with p < 2^31 and 32-bit shingle
+# hashes the product always fits in uint64.
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+# Jaccard scores at or above DUPLICATE_THRESHOLD are treated as the same
+# query, scores below DISTINCT_THRESHOLD as different; anything in between is
+# left to the LLM similarity check.
+DUPLICATE_THRESHOLD = 0.75
+DISTINCT_THRESHOLD = 0.45
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()
+
+
+def shingles(text: str, char_size: int = 4) -> set[str]:
+    """Word unigrams/bigrams plus character n-grams of the normalized text"""
+    normalized = normalize_text(text)
+    words = normalized.split()
+    result = set(words)
+    result.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    padded = f" {normalized} "
+    result.update(padded[i:i + char_size] for i in range(max(1, len(padded) - char_size + 1)))
+    return result
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class QueryIndex:
+    """
+    MinHash/LSH index answering "has a near-identical query already been
+    asked?" without calling the model. Candidates sharing at least one LSH
+    band are ranked by MinHash agreement in one vectorized pass, and the
+    best few are re-scored with the exact Jaccard similarity of their
+    shingle sets, so lookups stay cheap however many queries accumulate.
+
+    With 20 bands of 3 rows, pairs above ~0.37 Jaccard are retrieved with
+    high probability, which covers the borderline range handed to the LLM.
+    """
+
+    def __init__(self, bands: int = 20, rows: int = 3, seed: int = 7, rescore: int = 3):
+        self.bands = bands
+        self.rows = rows
+        self.rescore = rescore
+        rng = np.random.default_rng(seed)
+        num_perm = bands * rows
+        self._signatures = np.empty((64, num_perm), dtype=np.uint64)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._queries = []
+        self._shingles = []
+        self._known = {}
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def _signature(self, shingle_set: set[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set)
+        )
+        mixed = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return mixed.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, query: str):
+        key = normalize_text(query)
+        if key in self._known:
+            return
+        shingle_set = shingles(query)
+        idx = len(self._queries)
+        self._queries.append(query)
+        self._shingles.append(shingle_set)
+        self._known[key] = idx
+
+        signature = self._signature(shingle_set)
+        if idx == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[idx] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(idx)
+
+    def most_similar(self, query: str) -> tuple[str, float]:
+        """Closest indexed query and its Jaccard score, (None, 0.0) if none"""
+        exact = self._known.get(normalize_text(query))
+        if exact is not None:
+            return self._queries[exact], 1.0
+        if not self._queries:
+            return None, 0.0
+
+        shingle_set = shingles(query)
+        signature = self._signature(shingle_set)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        if not candidates:
+            return None, 0.0
+
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        agreement = (self._signatures[candidates] == signature).sum(axis=1)
+        top = candidates[np.argsort(agreement)[::-1][:self.rescore]]
+
+        best, best_score = None, 0.0
+        for idx in top:
+            score = jaccard(shingle_set, self._shingles[idx])
+            if score > best_score:
+                best, best_score = self._queries[idx], score
+        return best, best_score
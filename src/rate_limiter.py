@@ -0,0 +1,210 @@
+import asyncio
+import os
+import random
+import time
+
+from google.api_core.exceptions import ResourceExhausted
+
+
+# No client-side quota by default: calls are only slowed down by the
+# backoff after a 429. Set the budget of every model globally with
+# GEMINI_RPM / GEMINI_TPM (e.g. 15 / 1000000 on the free tier), or per model
+# through DeepSearch(rate_limits=...).
+DEFAULT_RATE_LIMITS = {
+    name: int(os.environ[variable])
+    for name, variable in (("rpm", "GEMINI_RPM"), ("tpm", "GEMINI_TPM"))
+    if os.environ.get(variable)
+}
+
+# Label of the only key when no KeyPool is given
+DEFAULT_KEY = "key1"
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota errors from either SDK (ResourceExhausted / HTTP 429)"""
+    if isinstance(error, ResourceExhausted):
+        return True
+    return getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size used to reserve TPM budget before the real count is known"""
+    return max(1, len(text) // 4)
+
+
+def response_tokens(response) -> int:
+    """Total tokens reported by usage_metadata, 0 when the SDK did not return any"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0
+    return getattr(usage, "total_token_count", None) or 0
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at capacity-per-minute. The level may go
+    negative: a reservation larger than what is available is granted
+    immediately and the debt is paid back by the callers queued behind it.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        self._refill(now)
+        deficit = min(amount, self.capacity) - self.level
+        return deficit / self.fill_rate if deficit > 0 else 0.0
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Correct a previous reservation once the real usage is known"""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelRateLimiter:
+    """
+    RPM and TPM buckets for a single model and key (None when that limit is
+    not enforced), plus a cool-down set after a 429
+    """
+
+    def __init__(self, rpm: int = None, tpm: int = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.sent = 0
+
+    def wait_for(self, tokens: int, now: float) -> float:
+        """How long a request of that size would wait, without booking it"""
+        return max(
+            self.blocked_until - now,
+            self.requests.delay_for(1, now) if self.requests else 0.0,
+            self.tokens.delay_for(tokens, now) if self.tokens else 0.0,
+            0.0
+        )
+
+    def headroom(self) -> float:
+        """Request slots left, or minus the requests sent so far when RPM is not enforced"""
+        return self.requests.level if self.requests else -self.sent
+
+    def reserve(self, tokens: int) -> float:
+        """Book one request slot and return how long the caller must wait for it"""
+        delay = self.wait_for(tokens, time.monotonic())
+        self.sent += 1
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(tokens)
+        return delay
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Shared limiter for all Gemini traffic of a DeepSearch instance. Each
+    API key has its own RPM/TPM budget per model, when one is configured
+    (limits or DEFAULT_RATE_LIMITS); every request goes to the key with the
+    most headroom, so throughput grows with the number of keys. Calls reserve capacity before being sent and are delayed instead
+    of failing; a ResourceExhausted response cools the key down for that
+    model and the call is queued again, on whichever key is then freest,
+    with exponential backoff.
+    """
+
+    def __init__(self, limits: dict[str, dict] = None, metrics=None,
+                 max_retries: int = 5, base_backoff: float = 2.0, max_backoff: float = 60.0,
+                 keys: list[str] = None):
+        self.limits = limits or {}
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.keys = keys or [DEFAULT_KEY]
+        self._models = {}  # (key, model) -> ModelRateLimiter
+
+    def _for_model(self, model_name: str, key: str = DEFAULT_KEY) -> ModelRateLimiter:
+        if (key, model_name) not in self._models:
+            limits = {**DEFAULT_RATE_LIMITS, **self.limits.get(model_name, {})}
+            self._models[key, model_name] = ModelRateLimiter(limits.get("rpm"), limits.get("tpm"))
+        return self._models[key, model_name]
+
+    def choose_key(self, model_name: str, tokens: int) -> str:
+        """Key with the most headroom for a request: shortest wait, then most request slots left"""
+        now = time.monotonic()
+
+        def load(key):
+            limiter = self._for_model(model_name, key)
+            return limiter.wait_for(tokens, now), -limiter.headroom()
+
+        return min(self.keys, key=load)
+
+    async def acquire(self, model_name: str, tokens: int) -> str:
+        """Book a slot on the freest key, wait for it, and return the key"""
+        key = self.choose_key(model_name, tokens)
+        delay = self._for_model(model_name, key).reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+            if self.metrics:
+                self.metrics.add_time("rate_limiter_wait_seconds", delay)
+                self.metrics.increment("rate_limiter_delayed_calls")
+        return key
+
+    def try_acquire(self, model_name: str, tokens: int) -> str:
+        """Book a slot only if one is available right now (used for optional extra calls); its key, else None"""
+        key = self.choose_key(model_name, tokens)
+        limiter = self._for_model(model_name, key)
+        if limiter.wait_for(tokens, time.monotonic()) > 0:
+            return None
+        limiter.reserve(tokens)
+        return key
+
+    def record_usage(self, model_name: str, reserved: int, actual: int, key: str = DEFAULT_KEY):
+        limiter = self._for_model(model_name, key)
+        if actual and limiter.tokens:
+            limiter.tokens.adjust(actual - reserved)
+        if self.metrics:
+            self.metrics.increment(f"key_calls_{key}")
+            self.metrics.increment(f"key_tokens_{key}", actual)
+
+    def backoff(self, model_name: str, attempt: int, key: str = DEFAULT_KEY) -> float:
+        """Cool the key down for the model after a quota error and return the chosen delay"""
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        delay += random.uniform(0, delay / 2)
+        self._for_model(model_name, key).block_for(delay)
+        if self.metrics:
+            self.metrics.increment("rate_limit_errors")
+            self.metrics.increment(f"key_rate_limit_errors_{key}")
+        return delay
+
+    async def call(self, model_name: str, prompt: str, send, acquired: str = None):
+        """
+        Run send(key) under the limiter, re-queueing it on quota errors.
+        acquired is a key whose slot was already booked through
+        try_acquire(), used for the first attempt.
+        """
+        reserved = estimate_tokens(prompt)
+        attempt = 0
+        key = acquired
+        while True:
+            if key is None:
+                key = await self.acquire(model_name, reserved)
+            try:
+                response = await send(key)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self.backoff(model_name, attempt, key)
+                attempt += 1
+                key = None
+                continue
+            self.record_usage(model_name, reserved, response_tokens(response), key)
+            return response
@@ -0,0 +1,197 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+from .rate_limiter import is_rate_limit_error
+
+# Error classes, see classify_error
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+DETERMINISTIC = "deterministic"
+UNKNOWN = "unknown"
+
+TRANSIENT_CODES = {408, 500, 502, 503, 504}
+DETERMINISTIC_CODES = {400, 401, 403, 404, 422}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit of an endpoint is open"""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    rate_limit: quota errors, already retried by the RateLimiter.
+    transient: timeouts, connection failures and 5xx, worth retrying.
+    deterministic: requests the API rejects as such (4xx, blocked or
+    unparsable answers), that would fail the same way if sent again.
+    unknown: anything else, neither retried nor cached.
+    """
+    if is_rate_limit_error(error):
+        return RATE_LIMIT
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return TRANSIENT
+    code = getattr(error, "code", None)
+    if code in TRANSIENT_CODES:
+        return TRANSIENT
+    if code in DETERMINISTIC_CODES or isinstance(error, ValueError):
+        return DETERMINISTIC
+    return UNKNOWN
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n waits U(0, min(max_delay, base_delay * 2**n))"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive transient failures and rejects
+    calls for reset_timeout seconds; then lets a single probe through,
+    closing again on its success and reopening on its failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """End a probe that says nothing about the endpoint (cancelled, unclassified error)"""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self, probe: bool = False) -> bool:
+        """Count a transient failure; True when it (re)opens the circuit"""
+        self.failures += 1
+        if probe:
+            self._probing = False
+        if probe or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class NegativeCache:
+    """Deterministic failures remembered for ttl seconds, so identical requests fail without an API call"""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._entries = {}  # key -> (error, expires_at)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        error, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        return error
+
+    def put(self, key: str, error: Exception):
+        if self.ttl > 0:
+            self._entries[key] = (error, time.monotonic() + self.ttl)
+
+
+class RetryEngine:
+    """
+    Shared retry policy for Gemini calls: transient errors are retried with
+    jittered exponential backoff behind a circuit breaker per endpoint, and
+    deterministic failures are cached for a short while. Every retry,
+    rejection and cached failure is counted in the metrics.
+    """
+
+    def __init__(self, policy: RetryPolicy = None, metrics=None, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, negative_ttl: float = 60.0):
+        self.policy = policy or RetryPolicy()
+        self.metrics = metrics
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.negative_cache = NegativeCache(negative_ttl)
+        self.breakers = {}  # endpoint -> CircuitBreaker
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+
+    def _count(self, name: str, amount: int = 1):
+        if self.metrics:
+            self.metrics.increment(name, amount)
+
+    async def call(self, endpoint: str, request_key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self.negative_cache.get(request_key)
+        if cached is not None:
+            self._count("negative_cache_hits")
+            raise cached
+
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count("circuit_rejected_calls")
+                raise CircuitOpenError(f"Circuit open for {endpoint} after repeated failures")
+            probe = breaker.opened_at is not None
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                if probe:
+                    breaker.release()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == TRANSIENT:
+                    if breaker.record_failure(probe):
+                        self._count("circuit_opened")
+                elif kind == DETERMINISTIC:
+                    breaker.record_success()  # the endpoint itself answered
+                    self.negative_cache.put(request_key, e)
+                    self._count("negative_cache_stored")
+                elif probe:
+                    breaker.release()
+                if kind != TRANSIENT or attempt + 1 >= self.policy.max_attempts:
+                    self._count(f"failed_calls_{kind}")
+                    raise
+                delay = self.policy.delay(attempt)
+                attempt += 1
+                self._count("retries")
+                self._count(f"retries_{endpoint}")
+                if self.metrics:
+                    self.metrics.add_time("retry_wait_seconds", delay)
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
@@ -0,0 +1,64 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: while a call for a key is in
+    flight, later callers with the same key await that call instead of
+    issuing their own. Followers get a deep copy of the result so callers
+    never share mutable answers. The shared call is cancelled only once
+    every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> _Flight
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], metrics=None) -> Any:
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(key)
+        # Calls are only shared within one event loop
+        leader = flight is None or flight.task.done() or flight.task.get_loop() is not loop
+        if leader:
+            flight = _Flight(loop.create_task(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        elif metrics:
+            metrics.increment("coalesced_requests")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Forget the call right away: a caller arriving before the
+                # cancellation completes must start a new one, not join it
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+        return result if leader else copy.deepcopy(result)
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Retrieved here so a failure nobody awaits any more is not logged as lost
+            flight.task.exception()
+
+
+# Shared by every DeepSearch instance of the process, so concurrent research
+# jobs coalesce their identical requests too
+IN_FLIGHT = SingleFlight()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from .progress_events import ProgressEvent, ProgressTree
+
+# Minimum delay between two full snapshots of the research tree
+SNAPSHOT_INTERVAL = 2.0
+
+
+def atomic_write_text(path, text: str):
+    """Write text to a temp file next to path, then rename it over path"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    atomic_write_text(path, json.dumps(data, **dump_kwargs))
+
+
+class TreeJournal:
+    """
+    Progress subscriber appending every event to a JSONL file, one line per
+    event, flushed as written. The journal is started afresh by open() at
+    the beginning of a run and only ever appended to afterwards.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def __call__(self, event: ProgressEvent):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TreeSnapshotWriter:
+    """
+    Progress subscriber keeping research_tree.json current. The tree is
+    rebuilt incrementally from events and written atomically at most once
+    every interval seconds; flush() writes the final state.
+    """
+
+    def __init__(self, path, interval: float = SNAPSHOT_INTERVAL):
+        self.path = Path(path)
+        self.interval = interval
+        self.tree = ProgressTree()
+        self._dirty = False
+        self._written_at = 0.0
+
+    async def __call__(self, event: ProgressEvent):
+        self.tree.apply(event)
+        self._dirty = True
+        if time.monotonic() - self._written_at >= self.interval:
+            await self.flush()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        # Serialize on the loop (the tree keeps changing), write off it
+        data = json.dumps(self.tree.root)
+        self._dirty = False
+        self._written_at = time.monotonic()
+        await asyncio.to_thread(atomic_write_text, self.path, data)
+
+
+def read_journal(path, offset: int = 0) -> tuple[list[ProgressEvent], int]:
+    """
+    Events appended to a journal since byte offset, and the offset to resume
+    from. A trailing line still being written is left for the next call.
+    """
+    events = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                events.append(ProgressEvent(**json.loads(line)))
+    return events, offset
+
+
+def replay_journal(path) -> dict:
+    """Rebuild the research tree of a run from its journal"""
+    tree = ProgressTree()
+    events, _ = read_journal(path)
+    for event in events:
+        tree.apply(event)
+    return tree.root
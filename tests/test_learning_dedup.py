@@ -0,0 +1,53 @@
+from src.learning_dedup import cluster_learnings
+
+
+def representatives(*learnings, threshold=0.9):
+    return [cluster["learning"] for cluster in cluster_learnings(list(learnings), threshold=threshold)]
+
+
+def test_paraphrases_are_merged():
+    learnings = [
+        "En 2017, l'OCDE a investi 364 milliards d'euros dans le recyclage.",
+        "En 2017, l'OCDE a investi 364 milliards d'euros dans le recyclage environ.",
+    ]
+    assert representatives(*learnings) == learnings[:1]
+
+
+def test_different_dates_are_kept():
+    learnings = [
+        "L'Union européenne prévoit de doubler ses capacités d'hydrogène vert d'ici 2025.",
+        "L'Union européenne prévoit de doubler ses capacités d'hydrogène vert d'ici 2030.",
+    ]
+    assert representatives(*learnings, threshold=0.5) == learnings
+
+
+def test_opposite_directions_are_kept():
+    learnings = [
+        "According to the annual report, the company's revenue grew 12% in 2023.",
+        "According to the annual report, the company's revenue shrank 12% in 2023.",
+    ]
+    assert representatives(*learnings, threshold=0.5) == learnings
+
+
+def test_negation_is_kept():
+    learnings = [
+        "The regulator approved the merger of the two largest utilities in 2024.",
+        "The regulator did not approve the merger of the two largest utilities in 2024.",
+    ]
+    assert representatives(*learnings, threshold=0.5) == learnings
+
+
+def test_different_acronyms_are_kept():
+    learnings = [
+        "En 2021, l'OCDE a investi 215 milliards d'euros dans l'éolien en mer.",
+        "En 2021, l'AIE a investi 215 milliards d'euros dans l'éolien en mer.",
+    ]
+    assert representatives(*learnings, threshold=0.5) == learnings
+
+
+def test_members_keep_their_queries():
+    clusters = cluster_learnings(
+        ["Solar capacity doubled in 2023.", "Solar capacity doubled in 2023!"],
+        ["query a", "query b"])
+    assert len(clusters) == 1
+    assert clusters[0]["queries"] == ["query a", "query b"]
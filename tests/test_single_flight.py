@@ -0,0 +1,44 @@
+import asyncio
+
+from src.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do("key", fetch) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{"answer": 42}] * 3
+    assert results[0] is not results[1]
+
+
+def test_caller_arriving_as_last_waiter_leaves_starts_a_new_call():
+    started = []
+
+    async def fetch():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return len(started)
+
+    async def main():
+        flights = SingleFlight()
+        first = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # Same tick as the cancellation: the abandoned call is still winding down
+        await asyncio.sleep(0)
+        second = await flights.do("key", fetch)
+        assert first.cancelled()
+        return second
+
+    assert asyncio.run(main()) == 2
+    assert len(started) == 2
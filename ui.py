@@ -19,6 +19,8 @@ def parse_arguments():
     parser = ArgumentParser(description="Interface de recherche avancée Gemini")
     parser.add_argument("--debug", action="store_true", help="Activer le mode debug")
     parser.add_argument("--clean", action="store_true", help="Nettoyer les fichiers temporaires avant exécution")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None,
+                        help="Reprendre une recherche interrompue à partir de son point de reprise")
     return parser.parse_args()
 
 
@@ -52,7 +54,7 @@ async def main():
                 logger.info("Fichier temporaire research_tree.json supprimé")
         
         # Exécuter l'interface de recherche
-        await run_research_interface()
+        await run_research_interface(args.resume)
         
     except KeyboardInterrupt:
         console.print(f"[bold {THEME['error_color']}]Recherche interrompue par l'utilisateur.[/bold {THEME['error_color']}]")
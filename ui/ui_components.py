@@ -85,6 +85,7 @@ def help_panel():
     modes_table.add_row("⚡", TRANSLATION['help_mode_fast'])
     modes_table.add_row("⚖️", TRANSLATION['help_mode_balanced'])
     modes_table.add_row("🔍", TRANSLATION['help_mode_comprehensive'])
+    modes_table.add_row("⏹", TRANSLATION['cancel_hint'])
     
     # Assembler le contenu d'aide
     help_content = Group(modes_table)
@@ -16,6 +16,8 @@ from dotenv import load_dotenv
 from rich.console import Console
 from rich.box import HEAVY
 
+from src.progress_events import SOURCES_ADDED, ProgressEvent, ProgressTree
+
 # Configuration de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -40,6 +42,7 @@ class PathManager:
     GRAPHS_DIR = BASE_DIR / "graphs"
     SUMMARIES_DIR = BASE_DIR / "summaries"
     TEMP_DIR = BASE_DIR / "temp"
+    CACHE_DIR = BASE_DIR / "cache"
     
     @classmethod
     def ensure_all_dirs(cls) -> None:
@@ -109,6 +112,9 @@ TRANSLATION = {
     "generating_questions": "Génération des questions de suivi...",
     "combined_query": "Requête combinée :",
     "launching_research": "Lancement de la recherche approfondie...",
+    "resuming_research": "Reprise de la recherche",
+    "resume_hint": "Reprendre cette recherche avec : python ui.py --resume",
+    "checkpoint_not_found": "Aucun point de reprise trouvé pour la recherche",
     "research_in_progress": "Recherche en cours...",
     "loading_tree": "Chargement de l'arborescence...",
     
@@ -166,6 +172,9 @@ TRANSLATION = {
     "load_config": "Charger une configuration",
     "back_to_home": "Retour à l'accueil",
     "cancel_confirm": "Êtes-vous sûr de vouloir annuler la recherche en cours ?",
+    "cancel_hint": "Ctrl+C : annuler la recherche (les apprentissages obtenus sont conservés)",
+    "cancelling_research": "Annulation de la recherche en cours...",
+    "research_cancelled": "Recherche annulée, apprentissages conservés :",
     "retry": "Réessayer",
     
     # Messages d'erreur
@@ -189,14 +198,19 @@ class UIStateManager:
     def _initialize(self):
         """Initialise l'état par défaut"""
         self.tree_data = {}
+        self.progress_tree = ProgressTree()
         self.visited_urls = {}
         self.start_time = time.time()
         self.is_searching = False
+        self.cancel_requested = False
         self.current_mode = "balanced"
         self.current_query = ""
         self.breadth = 10
         self.depth = 5
         self.learnings = []
+        self.learning_branches = []
+        self.metrics = {}
+        self.budget = {}
         self.report_path = None
         self.graph_path = None
         self.notifications = []
@@ -209,8 +223,18 @@ class UIStateManager:
     def update_tree(self, tree_data: Dict[str, Any]) -> None:
         """Met à jour l'arbre de recherche"""
         self.tree_data = tree_data
-        self._save_tree_snapshot()
         
+    def apply_event(self, event: ProgressEvent) -> None:
+        """Applique un événement de progression à l'arbre en mémoire"""
+        self.progress_tree.apply(event)
+        self.tree_data = self.progress_tree.root
+        if event.type == SOURCES_ADDED:
+            known = {url.get("link") for url in self.visited_urls.values()}
+            for source in event.sources.values():
+                if source.get("link") not in known:
+                    self.visited_urls[len(self.visited_urls)] = source
+                    known.add(source.get("link"))
+
     def update_urls(self, urls: Dict[str, Any]) -> None:
         """Met à jour les URLs visitées"""
         self.visited_urls = urls
@@ -232,14 +256,6 @@ class UIStateManager:
         """Retourne le temps écoulé depuis le début"""
         return time.time() - self.start_time
     
-    def _save_tree_snapshot(self) -> None:
-        """Sauvegarde un instantané de l'arbre pour mise à jour en direct"""
-        try:
-            with open("research_tree.json", "w", encoding="utf-8") as f:
-                json.dump(self.tree_data, f, indent=2)
-        except Exception as e:
-            logger.error(f"Erreur lors de la sauvegarde de l'instantané: {e}")
-
     def get_stats(self) -> Dict[str, Any]:
         """Calcule et retourne les statistiques courantes"""
         total, completed = count_nodes(self.tree_data)
@@ -297,12 +313,17 @@ class FileManager:
             return None
 
     @staticmethod
-    def save_markdown(report: str, query: str) -> Optional[str]:
-        """Sauvegarde le rapport markdown avec formatage du nom de fichier"""
+    def report_path(query: str) -> Path:
+        """Chemin horodaté du rapport markdown pour une requête"""
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_query = sanitize_filename(query, max_length=50)
         filename = f"report_{safe_query}_{timestamp}.md"
-        path = PathManager.get_path("reports", filename)
+        return PathManager.get_path("reports", filename)
+
+    @staticmethod
+    def save_markdown(report: str, query: str, path: Optional[Path] = None) -> Optional[str]:
+        """Sauvegarde le rapport markdown avec formatage du nom de fichier"""
+        path = path or FileManager.report_path(query)
         
         try:
             with open(path, "w", encoding="utf-8") as f:
@@ -687,7 +687,8 @@ class ResearchSummaryExporter:
     @staticmethod
     def export_summary(tree_data: Dict[str, Any], visited_urls: Dict[str, Any], 
                        query: str, learnings: List[str], start_time: float, 
-                       end_time: float) -> Optional[str]:
+                       end_time: float, metrics: Optional[Dict[str, Any]] = None,
+                       budget: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """Exporte un résumé complet de la recherche au format JSON"""
         if not tree_data:
             logger.warning("Tentative d'exportation d'un résumé sans données d'arbre")
@@ -730,6 +731,8 @@ class ResearchSummaryExporter:
                 "total_learnings": knowledge_count,
                 "total_sources": len(visited_urls) if visited_urls else 0
             },
+            "budget": budget or {},
+            "metrics": metrics or {},
             "research_tree": tree_data,
             "learnings": learnings,
             "sources": visited_urls
@@ -3,10 +3,9 @@ UI Workflow - Logique principale du workflow de recherche
 Implémente le contrôleur MVC pour coordonner l'interface utilisateur
 """
 
-import os
-import json
 import asyncio
 import datetime
+import signal
 import time
 import traceback
 from pathlib import Path
@@ -16,14 +15,15 @@ from dotenv import load_dotenv
 from rich.prompt import Prompt, Confirm
 from rich.console import Group
 from rich.panel import Panel
-from rich.markdown import Markdown
 from rich.align import Align
 from rich.layout import Layout
 from rich.live import Live
 from rich.text import Text
 from google.api_core.exceptions import ResourceExhausted
 
+from src.checkpoint import ResearchCheckpoint, new_run_id
 from src.deep_research import DeepSearch
+from src.key_pool import load_api_keys
 from .ui_core import (
     console, logger, THEME, TRANSLATION, state_manager,
     PathManager, FileManager
@@ -42,9 +42,11 @@ class DeepResearchController:
     def __init__(self):
         """Initialisation du contrôleur"""
         self.ds = None
-        self.api_key = os.getenv("GEMINI_KEY")
+        self.api_keys = []
         self.layout = None
         self.update_task = None
+        self.run_id = None
+        self._previous_sigint = None
         
     async def initialize(self):
         """Initialisation asynchrone des ressources"""
@@ -54,8 +56,9 @@ class DeepResearchController:
         # Charger les variables d'environnement
         load_dotenv()
         
-        # Vérifier la clé API
-        if not self.api_key:
+        # Vérifier les clés API (GEMINI_KEYS_FILE, GEMINI_KEYS ou GEMINI_KEY)
+        self.api_keys = load_api_keys()
+        if not self.api_keys:
             logger.error("Clé API Gemini manquante dans les variables d'environnement")
             console.print(Panel(
                 f"[{THEME['error_color']}]Erreur: Clé API Gemini non configurée. "
@@ -121,7 +124,7 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                 box=THEME['box_style']
             ))
             
-            follow_up_questions = self.ds.generate_follow_up_questions(initial_query)
+            follow_up_questions = await self.ds.generate_follow_up_questions(initial_query)
             
             # Utilisation d'une liste compréhension et validation
             if not follow_up_questions:
@@ -160,19 +163,30 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
         combined = f"Initial query: {initial_query}\n\nFollow up Q&A:\n{qa_text}"
         return combined
     
+    def cancel_research(self):
+        """Action utilisateur d'annulation : arrête les requêtes en cours en conservant les apprentissages"""
+        if self.ds and state_manager.is_searching and not state_manager.cancel_requested:
+            state_manager.cancel_requested = True
+            logger.info("Annulation de la recherche demandée par l'utilisateur")
+            self.ds.cancel()
+        # Un second Ctrl+C retrouve le comportement habituel
+        self._restore_sigint()
+    
+    def _restore_sigint(self):
+        """Retire le gestionnaire d'annulation et rétablit le précédent"""
+        if self._previous_sigint is not None:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGINT)
+            signal.signal(signal.SIGINT, self._previous_sigint)
+            self._previous_sigint = None
+    
     async def update_display(self):
         """Fonction asynchrone de mise à jour de l'affichage"""
         try:
             while True:
                 try:
-                    # Lire l'arbre de recherche actuel s'il existe
-                    try:
-                        with open("research_tree.json", "r", encoding="utf-8") as f:
-                            tree_data = json.load(f)
-                        
-                        # Mettre à jour le gestionnaire d'état
-                        state_manager.update_tree(tree_data)
-                        
+                    # L'arbre est tenu à jour par les événements de progression
+                    tree_data = state_manager.tree_data
+                    if tree_data:
                         # Mettre à jour la visualisation de l'arbre
                         self.layout["tree"].update(ComponentRegistry.get("tree", tree_data=tree_data))
                         
@@ -183,24 +197,17 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                                                                          start_time=state_manager.start_time))
                         
                         # Mettre à jour la barre de progression
-                        progress_text = Text(TRANSLATION['research_in_progress'], style=f"bold {THEME['info_color']}")
+                        status_color = THEME['warning_color'] if state_manager.cancel_requested else THEME['info_color']
+                        status_key = 'cancelling_research' if state_manager.cancel_requested else 'research_in_progress'
+                        progress_text = Text(TRANSLATION[status_key], style=f"bold {status_color}")
                         self.layout["progress"].update(Panel(
                             progress_text,
-                            border_style=THEME['info_color'],
+                            border_style=status_color,
                             box=THEME['box_style']
                         ))
                         
-                    except FileNotFoundError:
-                        # Fichier tree.json pas encore créé, afficher un message d'attente
-                        loading_text = Text(TRANSLATION['loading_tree'], style=f"bold {THEME['warning_color']}")
-                        self.layout["tree"].update(Panel(
-                            loading_text,
-                            title=f"[bold {THEME['info_color']}]{TRANSLATION['research_structure']}[/]",
-                            border_style=THEME['tree_border'],
-                            box=THEME['box_style']
-                        ))
-                    except json.JSONDecodeError:
-                        # Fichier tree.json potentiellement en cours d'écriture
+                    else:
+                        # Aucune requête démarrée pour l'instant, afficher un message d'attente
                         loading_text = Text(TRANSLATION['loading_tree'], style=f"bold {THEME['warning_color']}")
                         self.layout["tree"].update(Panel(
                             loading_text,
@@ -226,13 +233,14 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
             # Capture propre des annulations de tâche
             logger.info("Tâche de mise à jour affichage annulée")
             
-    async def run_research(self, query: str, breadth: int, depth: int) -> Dict[str, Any]:
-        """Exécution de la recherche avec suivi de progression via le fichier research_tree.json"""
+    async def run_research(self, query: str, breadth: int, depth: int, resume: bool = False) -> Dict[str, Any]:
+        """Exécution de la recherche avec suivi de progression via les événements de DeepSearch"""
         console.print(f"[{THEME['info_color']}]{TRANSLATION['launching_research']}[/{THEME['info_color']}]")
         
         # Initialiser le temps de départ dans le gestionnaire d'état
         state_manager.start_time = time.time()
         state_manager.is_searching = True
+        state_manager.cancel_requested = False
         state_manager.current_query = query
         state_manager.breadth = breadth
         state_manager.depth = depth
@@ -242,18 +250,34 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
         self.layout["header"].update(ComponentRegistry.get("header"))
         self.layout["sidebar"].update(ComponentRegistry.get("help"))
         
+        # Ctrl+C annule proprement la recherche (un second Ctrl+C l'interrompt)
+        previous_handler = signal.getsignal(signal.SIGINT)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGINT, self.cancel_research)
+            self._previous_sigint = previous_handler
+        except (NotImplementedError, RuntimeError):
+            # Pas de gestionnaire de signaux asyncio (Windows) : Ctrl+C interrompt la recherche
+            pass
+        
         # Exécuter la recherche avec mise à jour en temps réel
         with Live(self.layout, refresh_per_second=4):
             # Lancer la tâche de mise à jour en arrière-plan
             self.update_task = asyncio.create_task(self.update_display())
             
             try:
-                # Exécuter la recherche
-                result = await self.ds.deep_research(query, breadth, depth, learnings=[], visited_urls={})
+                # Exécuter la recherche (ou reprendre les requêtes en attente d'un point de reprise)
+                if resume:
+                    result = await self.ds.resume_research(self.run_id)
+                else:
+                    result = await self.ds.deep_research(query, breadth, depth, learnings=[], visited_urls={},
+                                                         run_id=self.run_id)
                 
                 # Mettre à jour l'état
                 state_manager.update_urls(result.get("visited_urls", {}))
                 state_manager.learnings = result.get("learnings", [])
+                state_manager.learning_branches = result.get("learning_branches", [])
+                state_manager.metrics = result.get("metrics", {})
+                state_manager.budget = result.get("budget", {})
                 
                 # Ajouter un délai pour afficher la fin
                 await asyncio.sleep(1)
@@ -267,6 +291,11 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                 except asyncio.CancelledError:
                     pass
                 
+                if state_manager.budget.get("stopped_reason") == "cancelled":
+                    console.print(f"[{THEME['warning_color']}]{TRANSLATION['research_cancelled']} "
+                                  f"{len(state_manager.learnings)}[/{THEME['warning_color']}]")
+                    console.print(f"[{THEME['info_color']}]{TRANSLATION['resume_hint']} {self.run_id}[/{THEME['info_color']}]")
+                
                 return result
             except Exception as e:
                 # Nettoyer en cas d'erreur
@@ -283,6 +312,8 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                 console.print(f"[{THEME['error_color']}]{error_msg}[/{THEME['error_color']}]")
                 
                 return {"learnings": [], "visited_urls": {}}
+            finally:
+                self._restore_sigint()
     
     async def process_final_report(self, combined_query: str) -> Dict[str, Any]:
         """Traiter et afficher le rapport final"""
@@ -312,20 +343,24 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                     box=THEME['box_style']
                 ))
                 
-                report = self.ds.generate_final_report(combined_query, learnings, visited_urls)
-                
-                # Afficher un aperçu du rapport
-                report_preview = report[:2000] + "... [suite du rapport]" if len(report) > 2000 else report
-                md_report = Markdown(report_preview)
-                console.print(Panel(
-                    md_report,
-                    title=f"[bold {THEME['success_color']}]{TRANSLATION['final_report']}[/bold {THEME['success_color']}]",
-                    border_style=THEME['success_color'],
-                    box=THEME['box_style']
-                ))
+                # Diffuser le rapport dans la console et sur disque au fil de la génération
+                report_path = FileManager.report_path(combined_query.split("\n")[0])
+                console.rule(f"[bold {THEME['success_color']}]{TRANSLATION['final_report']}[/bold {THEME['success_color']}]")
+                with open(report_path, "w", encoding="utf-8") as stream_file:
+                    def on_chunk(text: str):
+                        stream_file.write(text)
+                        stream_file.flush()
+                        console.print(text, end="", markup=False, highlight=False)
+                    
+                    report = await self.ds.generate_final_report(
+                        combined_query, learnings, visited_urls, on_chunk=on_chunk,
+                        branches=state_manager.learning_branches
+                    )
+                console.print()
+                console.rule(style=THEME['success_color'])
                 
-                # Sauvegarder le rapport
-                report_path = FileManager.save_markdown(report, combined_query.split("\n")[0])
+                # Réécrire le rapport complet avec citations et section Sources
+                report_path = FileManager.save_markdown(report, combined_query.split("\n")[0], path=report_path)
                 if report_path:
                     console.print(Panel(
                         f"[{THEME['success_color']}]{TRANSLATION['report_saved']}[/{THEME['success_color']}]\n{report_path}",
@@ -359,7 +394,9 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                     combined_query.split("\n")[0], 
                     learnings, 
                     start_time, 
-                    end_time
+                    end_time,
+                    metrics=self.ds.metrics.snapshot(),
+                    budget=state_manager.budget
                 )
                 
                 if summary_path:
@@ -433,7 +470,7 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
         
         return result
     
-    async def run_research_interface(self) -> None:
+    async def run_research_interface(self, resume_run_id: Optional[str] = None) -> None:
         """Interface principale du laboratoire de recherche"""
         # Initialisation
         if not await self.initialize():
@@ -446,25 +483,39 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
             # Afficher l'écran de bienvenue
             ComponentRegistry.get("welcome_screen")
             
-            # Collecter les informations pour la recherche
-            initial_query = Prompt.ask(f"[bold {THEME['query_color']}]{TRANSLATION['enter_query']}[/]")
-            mode = Prompt.ask(
-                f"[bold {THEME['info_color']}]{TRANSLATION['select_mode']}[/]",
-                choices=["fast", "balanced", "comprehensive"],
-                default="balanced"
-            )
-            breadth = int(Prompt.ask(
-                f"[bold {THEME['info_color']}]{TRANSLATION['select_breadth']}[/]",
-                default="5"
-            ))
-            depth = int(Prompt.ask(
-                f"[bold {THEME['info_color']}]{TRANSLATION['select_depth']}[/]",
-                default="3"
-            ))
+            if resume_run_id:
+                # Reprendre les paramètres de la recherche interrompue
+                checkpoint = ResearchCheckpoint(resume_run_id)
+                if not checkpoint.exists():
+                    console.print(f"[bold {THEME['error_color']}]{TRANSLATION['checkpoint_not_found']} {resume_run_id}[/]")
+                    return
+                saved = checkpoint.load()
+                self.run_id = resume_run_id
+                initial_query = saved["query"]
+                mode, breadth, depth = saved["mode"], saved["breadth"], saved["depth"]
+                console.print(f"[{THEME['info_color']}]{TRANSLATION['resuming_research']} {resume_run_id}[/{THEME['info_color']}]")
+            else:
+                # Collecter les informations pour la recherche
+                self.run_id = new_run_id()
+                initial_query = Prompt.ask(f"[bold {THEME['query_color']}]{TRANSLATION['enter_query']}[/]")
+                mode = Prompt.ask(
+                    f"[bold {THEME['info_color']}]{TRANSLATION['select_mode']}[/]",
+                    choices=["fast", "balanced", "comprehensive"],
+                    default="balanced"
+                )
+                breadth = int(Prompt.ask(
+                    f"[bold {THEME['info_color']}]{TRANSLATION['select_breadth']}[/]",
+                    default="5"
+                ))
+                depth = int(Prompt.ask(
+                    f"[bold {THEME['info_color']}]{TRANSLATION['select_depth']}[/]",
+                    default="3"
+                ))
             
             # Initialiser DeepSearch avec gestion d'erreurs
             try:
-                self.ds = DeepSearch(api_key=self.api_key, mode=mode)
+                self.ds = DeepSearch(api_key=self.api_keys[0], api_keys=self.api_keys, mode=mode, cache_dir=PathManager.CACHE_DIR)
+                self.ds.events.subscribe(state_manager.apply_event)
             except Exception as e:
                 error_msg = f"Erreur lors de l'initialisation de DeepSearch: {e}"
                 logger.error(f"{error_msg}\n{traceback.format_exc()}")
@@ -475,11 +526,11 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                 ))
                 return
             
-            # Générer et poser des questions de suivi
-            follow_up_answers = await self.ask_follow_up_questions(initial_query)
+            # Générer et poser des questions de suivi (la requête reprise les contient déjà)
+            follow_up_answers = [] if resume_run_id else await self.ask_follow_up_questions(initial_query)
             
             # Combiner la requête avec les questions de suivi
-            combined_query = self.combine_query(initial_query, follow_up_answers)
+            combined_query = initial_query if resume_run_id else self.combine_query(initial_query, follow_up_answers)
             if follow_up_answers:
                 console.print(Panel(
                     f"[{THEME['info_color']}]{TRANSLATION['combined_query']}\n{combined_query}[/{THEME['info_color']}]",
@@ -488,7 +539,7 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
                 ))
             
             # Lancer la recherche
-            result = await self.run_research(combined_query, breadth, depth)
+            result = await self.run_research(combined_query, breadth, depth, resume=bool(resume_run_id))
             
             # Lire l'arbre final depuis le gestionnaire d'état
             tree_data = state_manager.tree_data
@@ -519,18 +570,24 @@ Y88b  d88P 888         d8888888888 888  T88b  Y88b  d88P 888    888
             # Traiter et générer le rapport final
             await self.process_final_report(combined_query)
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # Ctrl+C annule la tâche principale : le point de reprise reste sur disque
             logger.info("Recherche interrompue par l'utilisateur")
             console.print(f"[bold {THEME['error_color']}]Recherche interrompue par l'utilisateur.[/bold {THEME['error_color']}]")
+            if self.run_id:
+                console.print(f"[{THEME['info_color']}]{TRANSLATION['resume_hint']} {self.run_id}[/{THEME['info_color']}]")
         except Exception as e:
             error_msg = f"Erreur inattendue: {e}"
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
             console.print(f"[bold {THEME['error_color']}]{error_msg}[/bold {THEME['error_color']}]")
             console.print(traceback.format_exc())
+        finally:
+            if self.ds:
+                await self.ds.close()
 
 
 # Fonction principale exportée
-async def run_research_interface():
+async def run_research_interface(resume_run_id: Optional[str] = None):
     """Point d'entrée principal de l'interface de recherche"""
     controller = DeepResearchController()
-    await controller.run_research_interface()
\ No newline at end of file
+    await controller.run_research_interface(resume_run_id)
\ No newline at end of file